@@ -0,0 +1,125 @@
+from utils.equation_parser import compile_equations, numexpr, numba
+import numpy as np
+import argparse
+import time
+
+
+# A hall of fame shaped like PySR output: each equation nests the simpler ones before it
+EQUATIONS = [
+    "x1",
+    "(x1 * 2.31)",
+    "((x1 * 2.31) + x2)",
+    "(exp(x1 / 3.2) + x2)",
+    "((exp(x1 / 3.2) + x2) - log(x3 + 1.5))",
+    "(((exp(x1 / 3.2) + x2) - log(x3 + 1.5)) * x1)",
+    "((((exp(x1 / 3.2) + x2) - log(x3 + 1.5)) * x1) ^ 0.5)",
+    "(((((exp(x1 / 3.2) + x2) - log(x3 + 1.5)) * x1) ^ 0.5) / (x2 + exp(x3 * 0.1)))",
+    "((((((exp(x1 / 3.2) + x2) - log(x3 + 1.5)) * x1) ^ 0.5) / (x2 + exp(x3 * 0.1))) - (log(x1) * x3))",
+]
+PARAM_NAMES = ("x1", "x2", "x3")
+
+# Equations whose folded constants are zero divisors, infinite or NaN, which every backend must
+# evaluate to the same inf/NaN values as numpy rather than raising
+EDGE_EQUATIONS = [
+    "x1 / 0",
+    "x1 / (2.5 - 2.5)",
+    "x2 + 1 / 0",
+    "x2 - 1 / 0",
+    "x1 * log(-1.0)",
+    "(0 / 0) + x3",
+    "(x1 + x2) / ((x1 + x2) * 0)",
+]
+
+
+def time_call(func, args: list[np.ndarray], repeats: int) -> float:
+    """
+    Returns the best wall time of repeated calls of func(*args), in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def check_parity(backends: list[str], columns: list[np.ndarray]) -> list[str]:
+    """
+    Evaluates EQUATIONS and EDGE_EQUATIONS with every backend and compares each result to numpy's.
+
+    Returns:
+        list[str]: A description of each equation and backend that raised or disagreed with numpy.
+    """
+    mismatches = []
+    with np.errstate(all="ignore"):
+        for equation in EQUATIONS + EDGE_EQUATIONS:
+            expected = compile_equations([equation], PARAM_NAMES, "numpy")(*columns)[0]
+            for backend in backends[1:]:
+                try:
+                    result = compile_equations([equation], PARAM_NAMES, backend)(*columns)[0]
+                except Exception as e:
+                    mismatches.append(f"{backend} raised {type(e).__name__}: {e} on '{equation}'")
+                    continue
+                if not np.allclose(result, expected, equal_nan=True):
+                    mismatches.append(f"{backend} disagrees with numpy on '{equation}'")
+
+    return mismatches
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare equation evaluation backends across test-set sizes.")
+    parser.add_argument("--max-rows", type=int, default=10_000_000, help="Largest number of rows to time.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed calls per backend and size (best is kept).")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    backends = ["numpy"]
+    if numexpr is not None:
+        backends.append("numexpr")
+    if numba is not None:
+        backends.append("numba")
+
+    rng = np.random.default_rng(0)
+    row_counts = [n for n in (10 ** e for e in range(2, 9)) if n <= args.max_rows]
+
+    # Timings of backends that give different results would be meaningless
+    mismatches = check_parity(backends, [rng.uniform(-5, 5, 1000) for _ in PARAM_NAMES])
+    for mismatch in mismatches:
+        print(f"Parity check failed: {mismatch}")
+    if mismatches:
+        raise SystemExit(1)
+    print(f"Parity check passed for {', '.join(backends)} on {len(EQUATIONS) + len(EDGE_EQUATIONS)} equations")
+    print()
+
+    # Compile once per backend, timing compilation (including the Numba JIT) separately
+    functions = {}
+    for backend in backends:
+        start = time.perf_counter()
+        functions[backend] = compile_equations(EQUATIONS, PARAM_NAMES, backend)
+        functions[backend](*[rng.uniform(1, 5, 10) for _ in PARAM_NAMES])
+        print(f"{backend:>8} compile + first call: {1000 * (time.perf_counter() - start):.1f} ms")
+
+    print()
+    print(f"{'rows':>10} " + " ".join(f"{backend:>12}" for backend in backends) + "   (ms per evaluation of all equations)")
+
+    timings = {backend: [] for backend in backends}
+    for n_rows in row_counts:
+        columns = [rng.uniform(1, 5, n_rows) for _ in PARAM_NAMES]
+        with np.errstate(all="ignore"):
+            for backend in backends:
+                timings[backend].append(time_call(functions[backend], columns, args.repeats))
+
+        print(f"{n_rows:>10} " + " ".join(f"{1000 * timings[backend][-1]:>12.3f}" for backend in backends))
+
+    print()
+    for backend in backends[1:]:
+        faster = [n for n, t, t_np in zip(row_counts, timings[backend], timings["numpy"]) if t < t_np]
+        if faster:
+            print(f"{backend} is faster than numpy from {faster[0]} rows")
+        else:
+            print(f"{backend} was not faster than numpy at any size tested")
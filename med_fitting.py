@@ -1,9 +1,20 @@
-from utils.MEDProcessor import MEDProcessor
+from utils.MEDProcessor import MEDProcessor, run_key, warm_up_medeq, salvage_partial_hof
+from utils.MEDProcessor import build_discovery_settings, SEARCH_BUDGETS, SEARCH_SETTING_NAMES
+from utils.input_cache import load_input_csv, cached_file_digest
+from utils.equation_parser import BACKENDS
+from utils.SharedFrame import SharedFrame
+from utils.StageRecorder import StageRecorder, STAGE_FILE, PROFILE_ENV, PROFILE_GROUPS
+from utils.BatchManifest import BatchManifest, RUNNING, DONE, FAILED, TIMEOUT
+from utils.WorkerPool import WorkerPool
+from utils.BatchProgress import BatchProgress, past_run_durations, HISTORY_FILE
+from utils.BatchMetrics import BatchMetrics, MetricsServer
+from utils.proc_utils import partition_cores, available_memory
 import pandas as pd
-import itertools
+import os
 import time
-
-from utils.general_utils import find_hof_file, move_hof_file
+import traceback
+import itertools
+import argparse
 
 
 def run_med_processor(
@@ -13,10 +24,27 @@ def run_med_processor(
         target: str, 
         *, 
         split_seed: int=100, 
-        tt_split: int=0.7
-    ) -> None:
+        tt_split: int=0.7,
+        key: str | None = None,
+        backend: str = "numpy",
+        shared_data: dict | None = None,
+        data_digest: str | None = None,
+        cross_validation: dict | None = None,
+        stream_chunksize: int | None = None,
+        max_train_rows: int | None = None,
+        subsample_method: str = "maximin",
+        discovery_settings: dict | None = None,
+        aggregate_duplicates: bool = False,
+        track_memory: bool = True,
+        trace_heap: bool = False,
+        n_threads: int | None = None
+    ) -> dict[str, dict]:
     """
     Run the MED Processor for a study.
+
+    Every stage is timed, and its duration, row count and peak RSS are written as one JSON line
+    to stage_timings.jsonl in the results folder. With track_memory, each stage's peak process-tree
+    RSS is recorded too, and with trace_heap, its peak Python heap.
     
     Args:
     - in_df_path (str): The path to the CSV containing the labelled data.
@@ -27,30 +55,294 @@ def run_med_processor(
     Keyword Args:
     - split_seed (int): Random seed to select the test-train data with (default is 100).
     - tt_split (float): Proportion of data to use as training data (default is 0.7).
+    - key (str | None): Run key (see utils.MEDProcessor.run_key). If folder_save_path already holds a
+      completed discovery with this key, discovery is skipped and its hall_of_fame.csv is reused.
+    - backend (str): Equation evaluation backend for testing: "numpy", "numexpr" or "numba" (default is "numpy").
+    - shared_data (dict | None): Spec of a SharedFrame holding the already parsed in_df_path data. When given,
+      the data is used in place without re-reading the CSV.
+    - data_digest (str | None): Content hash of in_df_path, letting studies with the same seed share a split.
+    - cross_validation (dict | None): K-fold settings ("n_folds", "n_repeats"). When given, the study runs
+      cross-validation seeded with split_seed instead of a single train-test split, and tt_split is unused.
+    - stream_chunksize (int | None): Stream in_df_path in chunks of this many rows instead of loading it, keeping
+      memory bounded (see MEDProcessor.prepare_data_streaming).
+    - max_train_rows (int | None): Maximum number of train rows passed to discovery. Larger training sets are
+      subsampled with subsample_method, or with stream_chunksize, randomly sampled while streaming.
+    - subsample_method (str): "maximin", "grid" or "random" (see utils.general_utils.subsample_indices).
+    - discovery_settings (dict | None): Settings passed to med.discover (see utils.MEDProcessor.build_discovery_settings).
+    - aggregate_duplicates (bool): Collapse training rows with identical parameters into their mean target before discovery.
+    - track_memory (bool): Sample the process-tree RSS during each stage (default is True).
+    - trace_heap (bool): Trace the Python heap with tracemalloc during each stage, which slows allocation-heavy stages
+      several times over (default is False).
+    - n_threads (int | None): Number of parallel PySR workers (procs) for discovery, normally the thread share of the
+      worker slot running the regression (see resource_slots). None leaves procs to PySR (default is None).
+
+    Returns:
+    - dict[str, dict]: The seconds spent in each stage ("stages"), the rows it handled ("rows") and its memory peaks ("memory").
     """
     print("=" * 75)
     print(f"Running MED on - Study: {param_list}, Target: {target}, Seed: {split_seed}")
     print(f"MED Study folder Created: {folder_save_path}")
 
-    df = pd.read_csv(in_df_path)
-    
-    med_study = MEDProcessor(param_list, df, target, folder_save_path)
-    train_df, test_df, parameters = med_study.prepare_data(tt_split, split_seed)
-    med_study.run_med_discovery(train_df, parameters)
+    recorder = StageRecorder(
+        os.path.join(folder_save_path, STAGE_FILE),
+        track_memory=track_memory, trace_heap=trace_heap,
+        run=os.path.basename(folder_save_path), run_key=key, n_params=len(param_list)
+    )
+
+    try:
+        with recorder.stage("load_data") as event:
+            if stream_chunksize is not None:
+                data = pd.read_csv(in_df_path, nrows=0)  # Only the header, the rows are streamed below
+            elif shared_data is not None:
+                data = SharedFrame.attach(shared_data)
+            else:
+                data = load_input_csv(in_df_path, columns=[*param_list, target], digest=data_digest)
+            event["rows"] = data.n_rows if isinstance(data, SharedFrame) else len(data)
+
+        med_study = MEDProcessor(
+            param_list, data, target, folder_save_path,
+            backend=backend, data_key=data_digest, max_train_rows=max_train_rows, subsample_method=subsample_method,
+            discovery_settings=discovery_settings, aggregate_duplicates=aggregate_duplicates,
+            n_threads=n_threads,
+            recorder=recorder
+        )
+
+        run_info = {
+            "run_key": key,
+            "csv": in_df_path,
+            "param_list": param_list,
+            "target": target,
+            "split_seed": split_seed,
+            "tt_split": tt_split,
+            "discovery_settings": med_study.discovery_settings,
+            "aggregate_duplicates": aggregate_duplicates,
+            "n_threads": n_threads
+        }
+
+        if cross_validation is not None:
+            med_study.run_cross_validation(
+                cross_validation["n_folds"], split_seed, cross_validation["n_repeats"],
+                key=key, run_info={**run_info, "tt_split": None, "cross_validation": cross_validation}
+            )
+            print(f"Med cross-validation results saved to '{folder_save_path}/med_cv_unseen.csv'")
+            return recorder.summary()
+
+        if stream_chunksize is not None:
+            train_df, test_path, parameters = med_study.prepare_data_streaming(
+                in_df_path, tt_split, split_seed, chunksize=stream_chunksize, max_train_rows=max_train_rows
+            )
+        else:
+            train_df, test_df, parameters = med_study.prepare_data(tt_split, split_seed)
+
+        if key is not None and med_study.has_cached_discovery(key):
+            print(f"Reusing cached discovery results in '{folder_save_path}'")
+        else:
+            if not med_study.run_med_discovery(train_df, parameters, run_info=run_info, train_rows=med_study.train_idx):
+                raise RuntimeError(f"MED discovery did not produce a hall_of_fame.csv for '{folder_save_path}'")
+
+        # Test MED equations on unseen data
+        test_results_path = f"{folder_save_path}/med_unseen.csv"
+        if stream_chunksize is not None:
+            med_study.test_equations_streaming(test_path, chunksize=stream_chunksize, out_path=test_results_path)
+            os.remove(test_path)
+        else:
+            df_results = med_study.test_equations(test_df)
+            with recorder.stage("write_results", rows=len(df_results)):
+                df_results.to_csv(test_results_path)
+
+        print(f"Med test results saved to '{test_results_path}'")
+
+        return recorder.summary()
+    finally:
+        recorder.close()
+
+
+def run_folder_path(output_root: str, param_list: list[str], target: str, split_seed: int, key: str) -> str:
+    """
+    Builds the content-addressed results folder for a regression, e.g. med_post/target_col_param1-param3_s88_1a2b3c4d5e6f.
+    """
+    return os.path.join(output_root, f"{target}_{'-'.join(param_list)}_s{split_seed}_{key[:12]}")
+
+
+def run_job(job: dict) -> dict:
+    """
+    Run one regression, timing it and capturing any error so the batch can record it.
+
+    Args:
+    - job (dict): Keyword arguments for run_med_processor.
+
+    Returns:
+    - dict: The start and finish times, duration, seconds spent, rows handled and memory peaks of each stage, the highest
+      process-tree RSS of the run and the error message (None on success).
+    """
+    started = time.time()
+    summary = {"stages": None, "rows": None, "memory": None}
+    error = None
+
+    try:
+        summary = run_med_processor(**job)
+    except Exception as e:
+        traceback.print_exc()
+        error = f"{type(e).__name__}: {e}"
+
+    finished = time.time()
+
+    tree_rss = [peaks["tree_rss_mb"] for peaks in (summary["memory"] or {}).values() if peaks["tree_rss_mb"] is not None]
+
+    return {
+        "started": started,
+        "finished": finished,
+        "duration_s": finished - started,
+        **summary,
+        "peak_tree_rss_mb": max(tree_rss, default=None),
+        "error": error
+    }
+
+
+def init_worker(warm_up: bool):
+    """
+    Initialise a batch worker process. Workers are long-lived and run regressions back to back,
+    so medeq (imported with MEDProcessor) and, with warm_up, the Julia JIT are only paid for once.
+    """
+    if warm_up:
+        try:
+            print(f"Worker {os.getpid()} warmed up MED in {warm_up_medeq():.1f}s")
+        except Exception as e:
+            print(f"Worker {os.getpid()} could not warm up MED: {type(e).__name__}: {e}")
+
+
+def run_batch(
+        jobs: list[dict],
+        max_workers: int = 1,
+        manifest: BatchManifest | None = None,
+        warm_up: bool = False,
+        wall_timeout: float | None = None,
+        cpu_timeout: float | None = None,
+        slots: list[dict] | None = None,
+        memory_budget: float | None = None,
+        job_memory: list[float] | None = None,
+        progress: BatchProgress | None = None,
+        metrics: BatchMetrics | None = None
+    ) -> dict[int, dict]:
+    """
+    Run a batch of MED regressions, optionally in parallel worker processes.
+
+    With a wall-clock or CPU budget, every regression runs in a supervised worker process. A
+    regression over its budget is stopped together with any processes it started, the best
+    equations found so far are kept as hall_of_fame_partial.csv, and the batch carries on.
+
+    With slots, each worker is started with its own thread counts and CPU set (see resource_slots),
+    and with a memory budget, a regression only starts once its estimated memory fits next to the
+    ones already running.
+
+    Args:
+    - jobs (list[dict]): Keyword arguments for run_med_processor, one dict per regression.
+    - max_workers (int): Number of regressions to run at once (default is 1, which runs in this process
+      unless a budget or slots are set).
+    - manifest (BatchManifest | None): Manifest to record each regression's state in, keyed by the job's "key".
+    - warm_up (bool): Run a tiny MED discovery in each worker before it takes jobs (default is False).
+    - wall_timeout (float | None): Wall-clock seconds each regression may run for (default is no limit).
+    - cpu_timeout (float | None): CPU seconds each regression's processes may use in total (default is no limit).
+    - slots (list[dict] | None): Resources of each worker, as returned by resource_slots (default is inherited).
+    - memory_budget (float | None): Bytes of memory the running regressions may use together (default is no limit).
+    - job_memory (list[float] | None): Estimated bytes of memory each job needs (see estimate_job_memory).
+    - progress (BatchProgress | None): Follows the batch, printing its state and ETA after each regression.
+    - metrics (BatchMetrics | None): Counts started and finished regressions and their stage timings.
+
+    Returns:
+    - dict[int, dict]: The result of run_job for each job, keyed by job index.
+    """
+    total = len(jobs)
+    outcomes = {}
+
+    def start(index, pid=None):
+        if progress is not None:
+            progress.start(index)
+        if metrics is not None:
+            metrics.start()
+        if manifest is not None:
+            manifest.update(jobs[index]["key"], RUNNING, started=time.time(), error=None, pid=pid)
+
+    def report(index, result):
+        outcomes[index] = result
+        error = result["error"]
+
+        if result.get("timeout") is not None:
+            state = TIMEOUT
+            result["partial_hof"] = salvage_partial_hof(jobs[index]["folder_save_path"])
+            status = f"Timed out ({result['timeout']}, {len(result['partial_hof'])} partial hall of fame kept)"
+        else:
+            state = DONE if error is None else FAILED
+            status = "Finished" if error is None else f"Failed ({error})"
+
+        if manifest is not None:
+            manifest.update(jobs[index]["key"], state, **result)
+        if metrics is not None:
+            metrics.finish(state, result)
 
-    # MED saved discovered equations to /tmp on macos. Issue with the version of PySR used in MED.
-    # For now, this fix locates the hof file in /tmp and moves it to the correct directory 
-    hof_pattern = "/var/folders/lp/*/T**/**/hall_of_fame.csv"
-    hof_path = find_hof_file(hof_pattern)
-    move_hof_file(folder_save_path, hof_path)
-    time.sleep(0.1)
+        print(f"{status} regression {index + 1} ({len(outcomes)} out of {total} done, {100 * len(outcomes) / total:.2f}%)")
+        if progress is not None:
+            progress.finish(index, result)
+            print(progress.line())
 
-    # Test MED equations on unseen data
-    df_results = med_study.test_equations(test_df)
-    test_results_path = f"{folder_save_path}/med_unseen.csv"
-    df_results.to_csv(test_results_path)
+    if max_workers <= 1 and wall_timeout is None and cpu_timeout is None and slots is None:
+        init_worker(warm_up)
+        for index, job in enumerate(jobs):
+            start(index, os.getpid())
+            report(index, run_job(job))
 
-    print(f"Med test results saved to '{test_results_path}'")
+        return outcomes
+
+    # Julia does not survive a fork, so workers are always started fresh with spawn.
+    # Each worker is supervised, so one regression can be stopped without losing the others
+    pool = WorkerPool(
+        run_job, max_workers, initializer=init_worker, initargs=(warm_up,),
+        wall_timeout=wall_timeout, cpu_timeout=cpu_timeout, slots=slots, memory_budget=memory_budget
+    )
+    pool.run(jobs, on_start=start, on_finish=report, job_memory=job_memory)
+
+    return outcomes
+
+
+def resource_slots(n_workers: int, cores: int | None = None, pin: bool = False) -> list[dict]:
+    """
+    Split a core budget between concurrent regressions, so their searches do not oversubscribe the machine.
+
+    Args:
+    - n_workers (int): Number of regressions to run at once.
+    - cores (int | None): Total number of cores to use (default is every available CPU).
+    - pin (bool): Pin each worker to its own set of CPUs (default is False).
+
+    Returns:
+    - list[dict]: For each worker, the "threads" it gets, the "env" it is started with and the "cpus" it is pinned to.
+    """
+    return [
+        {**slot, "env": {name: slot["threads"] for name in THREAD_ENV_VARS}}
+        for slot in partition_cores(n_workers, cores, pin)
+    ]
+
+
+def estimate_job_memory(job: dict, n_rows: int, itemsize: int = 8) -> float:
+    """
+    Estimate the peak memory of a regression, in bytes.
+
+    Args:
+    - job (dict): Keyword arguments for run_med_processor.
+    - n_rows (int): Number of rows of input data the regression holds in memory.
+    - itemsize (int): Bytes per value of the input data (default is 8).
+
+    Returns:
+    - float: The estimated bytes.
+    """
+    data_bytes = n_rows * (len(job["param_list"]) + 1) * itemsize
+
+    # Cross-validation gathers one fold at a time, but keeps the test predictions of every fold until
+    # they are consolidated, and each repeat predicts every row once
+    copies = JOB_DATA_COPIES
+    if job.get("cross_validation"):
+        copies += job["cross_validation"]["n_repeats"] - 1
+
+    return JOB_BASE_MEMORY_GB * 2 ** 30 + copies * data_bytes
 
 
 # User defined MED regresssion parameters
@@ -61,45 +353,309 @@ SEEDS = [88, 92, 50, 57, 73, 77, 75, 93, 98, 96]
 # Parameter names that you wish to investigate in batches
 STUDIES_PARAMS = ["param1-param2-param3", "param1-param3", "param2-param3"]
 CSV_NAME = "data.csv"
+TARGET = "target_col"
+TT_SPLIT = 0.7
+OUTPUT_ROOT = "med_post"
+
+# Records the state of every regression in the batch, next to the output folder
+MANIFEST_PATH = "med_batch_manifest.json"
+
+# Number of regressions to run at once. Each PySR search is itself multithreaded,
+# so keep this well below the core count of the machine
+MAX_WORKERS = 1
+
+# Thread-count variables each worker is started with, from its share of the cores. Julia reads
+# its thread count once at start-up (through juliacall, from PYTHON_JULIACALL_THREADS)
+THREAD_ENV_VARS = (
+    "JULIA_NUM_THREADS", "PYTHON_JULIACALL_THREADS", "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS"
+)
+
+# Rough memory of one regression besides its data (a Julia process with PySR compiled), and the
+# number of copies of a study's columns alive at once (splits, MED's copy and test predictions)
+JOB_BASE_MEMORY_GB = 1.5
+JOB_DATA_COPIES = 4
+
 
-med_regression_params = list(itertools.product(SEEDS, STUDIES_PARAMS))
-total_regressions = len(med_regression_params)
-
-# START INFO TABLE ================================================
-TABLE_WIDTH = 60
-BORDER = "+" + "-" * (TABLE_WIDTH - 2) + "+"
-
-header = "MED REGRESSION BATCH"
-header_line = "| " + header.center(TABLE_WIDTH - 4) + " |"
-
-info_lines = [
-    f"Total regressions: {total_regressions}",
-    f"SEEDS: {', '.join(map(str, SEEDS))}",
-    f"STUDIES_PARAMS: {', '.join(STUDIES_PARAMS)}",
-    f"CSV: {CSV_NAME}"
-]
-
-formatted_info_lines = [
-    "| " + line.ljust(TABLE_WIDTH - 4) + " |" for line in info_lines
-]
-
-print(BORDER)
-print(header_line)
-print(BORDER)
-for line in formatted_info_lines:
-    print(line)
-print(BORDER)
-# END INFO TABLE ================================================
-
-# Iterate through MED regression parameters and perform regressions
-for index, (seed, study_params) in enumerate(med_regression_params):
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run a batch of MED regressions.")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of regressions to run at once.")
+    parser.add_argument(
+        "--backend", choices=BACKENDS, default="numpy",
+        help="Backend used to evaluate discovered equations on the test data."
+    )
+    parser.add_argument(
+        "--float32", action="store_true",
+        help="Downcast the input data to float32, halving its memory."
+    )
+    parser.add_argument(
+        "--warm-up", action="store_true",
+        help="Warm up MED (Julia start-up and JIT) once in each worker before it takes regressions."
+    )
+    parser.add_argument(
+        "--folds", type=int, default=None,
+        help="Run K-fold cross-validation with this many folds per study and seed, instead of a single train-test split."
+    )
+    parser.add_argument("--repeats", type=int, default=1, help="Number of repeats of the K-fold split (with --folds).")
+    parser.add_argument(
+        "--stream", type=int, default=None, metavar="CHUNKSIZE",
+        help="Stream the input CSV in chunks of this many rows instead of loading it, for data larger than memory."
+    )
+    parser.add_argument(
+        "--max-train-rows", type=int, default=None,
+        help="Pass at most this many train rows to discovery, subsampling larger training sets "
+             "(with --stream, a random sample is kept while streaming)."
+    )
+    parser.add_argument(
+        "--subsample-method", choices=["maximin", "grid", "random"], default="maximin",
+        help="How --max-train-rows selects rows: farthest-point (maximin), one per grid cell, or random."
+    )
+    parser.add_argument(
+        "--aggregate-duplicates", action="store_true",
+        help="Collapse training rows with identical parameters into one row with the mean target before discovery."
+    )
+    parser.add_argument(
+        "--wall-timeout", type=float, default=None,
+        help="Stop a regression after this many wall-clock seconds, keeping its partial hall of fame."
+    )
+    parser.add_argument(
+        "--cpu-timeout", type=float, default=None,
+        help="Stop a regression once its processes have used this many CPU seconds in total."
+    )
+    parser.add_argument(
+        "--profile", default=None, metavar="STAGES",
+        help=f"Profile these stages of every regression into its profiles/ folder: 'all', or comma-separated "
+             f"stage names or groups ({', '.join(PROFILE_GROUPS)}). Same as setting {PROFILE_ENV}."
+    )
+    parser.add_argument(
+        "--track-memory", action=argparse.BooleanOptionalAction, default=True,
+        help="Record each stage's peak process-tree RSS (sampled in the background) in the manifest."
+    )
+    parser.add_argument(
+        "--trace-heap", action="store_true",
+        help="Also record each stage's peak Python heap with tracemalloc. Slows allocation-heavy stages several times over."
+    )
+    parser.add_argument(
+        "--progress-interval", type=float, default=60.0,
+        help="Seconds between batch progress lines while regressions run (0 to only report as they finish)."
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, default=None,
+        help="Serve Prometheus metrics of the batch at http://<metrics-host>:PORT/metrics while it runs."
+    )
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address the metrics endpoint listens on.")
+    resources = parser.add_argument_group("resources", "Sharing the machine between concurrent regressions.")
+    resources.add_argument(
+        "--cores", type=int, default=None,
+        help="Total cores for the batch, split evenly into each worker's Julia and BLAS threads (default: all)."
+    )
+    resources.add_argument("--pin", action="store_true", help="Pin each worker to its own set of CPUs.")
+    resources.add_argument(
+        "--memory-gb", type=float, default=None,
+        help="Memory budget for the batch. A regression only starts once its estimated memory fits."
+    )
+    resources.add_argument(
+        "--job-memory-gb", type=float, default=None,
+        help="Override the estimated memory of each regression."
+    )
+    search = parser.add_argument_group("search budget", "PySR search settings, overriding those of --budget.")
+    search.add_argument("--budget", choices=list(SEARCH_BUDGETS), default=None, help="Named search budget.")
+    search.add_argument("--niterations", type=int, default=None)
+    search.add_argument("--populations", type=int, default=None)
+    search.add_argument("--population-size", type=int, default=None)
+    search.add_argument("--batching", action=argparse.BooleanOptionalAction, default=None)
+    search.add_argument("--batch-size", type=int, default=None)
+    search.add_argument("--maxsize", type=int, default=None)
+    search.add_argument("--timeout", type=int, default=None, help="PySR timeout_in_seconds for each search.")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"Skip regressions recorded as done in {MANIFEST_PATH} and rerun only failed or unfinished ones."
+    )
+
+    args = parser.parse_args()
+    if args.stream is not None and args.folds:
+        parser.error("--stream cannot be combined with --folds")
+    if args.folds is not None and args.folds < 2:
+        parser.error("--folds must be at least 2")
+    if args.repeats < 1:
+        parser.error("--repeats must be at least 1")
+    if args.pin and args.cores is not None and args.cores < args.workers:
+        parser.error("--pin needs at least as many --cores as --workers, so each worker gets its own CPUs")
+
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # Set in the environment, so regressions in worker processes see it too
+    if args.profile is not None:
+        os.environ[PROFILE_ENV] = args.profile
+
+    med_regression_params = list(itertools.product(SEEDS, STUDIES_PARAMS))
+    total_regressions = len(med_regression_params)
+
+    # START INFO TABLE ================================================
+    TABLE_WIDTH = 60
+    BORDER = "+" + "-" * (TABLE_WIDTH - 2) + "+"
+
+    header = "MED REGRESSION BATCH"
+    header_line = "| " + header.center(TABLE_WIDTH - 4) + " |"
+
+    info_lines = [
+        f"Total regressions: {total_regressions}",
+        f"SEEDS: {', '.join(map(str, SEEDS))}",
+        f"STUDIES_PARAMS: {', '.join(STUDIES_PARAMS)}",
+        f"CSV: {CSV_NAME}",
+        f"Workers: {args.workers}",
+        f"Search budget: {args.budget or 'default'}"
+    ]
+
+    formatted_info_lines = [
+        "| " + line.ljust(TABLE_WIDTH - 4) + " |" for line in info_lines
+    ]
+
+    print(BORDER)
+    print(header_line)
+    print(BORDER)
+    for line in formatted_info_lines:
+        print(line)
+    print(BORDER)
+    # END INFO TABLE ================================================
+
+    # Every slot gets the same share of the cores, which each job passes to PySR as its procs. Split
+    # before any data is loaded into shared memory, as an impossible split stops the batch
+    slots = None
+    if args.workers > 1 or args.cores is not None or args.pin:
+        slots = resource_slots(args.workers, args.cores, args.pin)
+        print(f"Each of {args.workers} workers gets {slots[0]['threads']} threads" + (", pinned" if args.pin else ""))
+
+    # Build the MED regression jobs, keyed by the input data and settings, and run them
     med_in_path = f"med_input_csvs/{CSV_NAME}"
-    med_out_path = f"med_post/med_{seed}"
+    data_digest = cached_file_digest(med_in_path)
+
+    # Load the CSV once through its columnar cache, keeping only the columns some study uses,
+    # and share it with every job. Streamed batches never hold the whole CSV in memory
+    shared_data = None
+    if args.stream is None:
+        used_columns = sorted({param for study_params in STUDIES_PARAMS for param in study_params.split("-")} | {TARGET})
+        shared_data = SharedFrame.from_dataframe(
+            load_input_csv(med_in_path, columns=used_columns, float32=args.float32, digest=data_digest),
+            dtype="float32" if args.float32 else "float64"
+        )
+
+    discovery_settings = build_discovery_settings(
+        args.budget,
+        niterations=args.niterations,
+        populations=args.populations,
+        population_size=args.population_size,
+        batching=args.batching,
+        batch_size=args.batch_size,
+        maxsize=args.maxsize,
+        timeout_in_seconds=args.timeout
+    )
+    cross_validation = {"n_folds": args.folds, "n_repeats": args.repeats} if args.folds else None
+    subsample = None
+    if args.max_train_rows is not None and args.stream is None:
+        subsample = {"max_train_rows": args.max_train_rows, "method": args.subsample_method}
+
+    jobs = []
+    for seed, study_params in med_regression_params:
+        sweep_parameter_list = study_params.split("-")
+        key = run_key(
+            data_digest, sweep_parameter_list, TARGET, seed, TT_SPLIT, discovery_settings,
+            float32=args.float32, cross_validation=cross_validation,
+            split_method="hash-stream" if args.stream is not None else None,
+            max_train_rows=args.max_train_rows if args.stream is not None else None,
+            aggregate_duplicates=args.aggregate_duplicates or None,
+            subsample=subsample
+        )
+
+        jobs.append({
+            "in_df_path": med_in_path,
+            "folder_save_path": run_folder_path(OUTPUT_ROOT, sweep_parameter_list, TARGET, seed, key),
+            "param_list": sweep_parameter_list,
+            "target": TARGET,
+            "split_seed": seed,
+            "tt_split": TT_SPLIT,
+            "key": key,
+            "backend": args.backend,
+            "shared_data": shared_data.spec if shared_data is not None else None,
+            "data_digest": data_digest,
+            "cross_validation": cross_validation,
+            "stream_chunksize": args.stream,
+            "max_train_rows": args.max_train_rows,
+            "subsample_method": args.subsample_method,
+            "discovery_settings": discovery_settings,
+            "aggregate_duplicates": args.aggregate_duplicates,
+            "track_memory": args.track_memory,
+            "trace_heap": args.trace_heap,
+            "n_threads": slots[0]["threads"] if slots is not None else None
+        })
+
+    # A fresh batch starts a new manifest, a resumed one carries on from the previous record
+    manifest = BatchManifest.load(MANIFEST_PATH) if args.resume else BatchManifest(MANIFEST_PATH)
+    for job in jobs:
+        manifest.add(
+            job["key"],
+            folder=job["folder_save_path"],
+            csv=job["in_df_path"],
+            param_list=job["param_list"],
+            target=job["target"],
+            split_seed=job["split_seed"],
+            budget=args.budget,
+            n_threads=job["n_threads"],
+            search_settings={name: value for name, value in discovery_settings.items() if name in SEARCH_SETTING_NAMES}
+        )
+    manifest.save()
+
+    if args.resume:
+        skipped = sum(manifest.is_done(job["key"]) for job in jobs)
+        jobs = [job for job in jobs if not manifest.is_done(job["key"])]
+        print(f"Resuming batch: skipping {skipped} finished regressions, {len(jobs)} left to run")
+
+
+    memory_budget = job_memory = None
+    if args.memory_gb is not None:
+        memory_budget = args.memory_gb * 2 ** 30
+        available = available_memory()
+        if available is not None and available < memory_budget:
+            print(f"Warning: the memory budget exceeds the {available / 2 ** 30:.1f} GB currently available")
+
+        if args.job_memory_gb is not None:
+            job_memory = [args.job_memory_gb * 2 ** 30] * len(jobs)
+        else:
+            # Streamed runs only hold their training rows in memory, counted here by max_train_rows when set
+            n_rows = shared_data.n_rows if shared_data is not None else (args.max_train_rows or 0)
+            job_memory = [estimate_job_memory(job, n_rows, 4 if args.float32 else 8) for job in jobs]
+
+    # Durations of earlier regressions under the output folder drive the ETA, and this batch's are added to them
+    progress = BatchProgress(
+        jobs, args.workers, past_run_durations(OUTPUT_ROOT), shared_data.n_rows if shared_data is not None else None,
+        history_path=os.path.join(OUTPUT_ROOT, HISTORY_FILE)
+    )
+    if args.progress_interval > 0:
+        progress.start_ticker(args.progress_interval)
 
-    sweep_parameter_list = study_params.split("-")
-    target = "target_col"
+    metrics = BatchMetrics(len(jobs))
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = MetricsServer(metrics, args.metrics_port, args.metrics_host).start()
+        print(f"Serving batch metrics at http://{args.metrics_host}:{metrics_server.port}/metrics")
 
-    run_med_processor(med_in_path, med_out_path, sweep_parameter_list, target, split_seed=seed)
-    print(f"Finished regression {index + 1} out of {total_regressions} ({100 * index / total_regressions:.2f}%)")
+    try:
+        outcomes = run_batch(
+            jobs, max_workers=args.workers, manifest=manifest, warm_up=args.warm_up,
+            wall_timeout=args.wall_timeout, cpu_timeout=args.cpu_timeout,
+            slots=slots, memory_budget=memory_budget, job_memory=job_memory, progress=progress, metrics=metrics
+        )
+    finally:
+        progress.stop_ticker()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if shared_data is not None:
+            shared_data.unlink()
 
-    break
+    timed_out = sum(result.get("timeout") is not None for result in outcomes.values())
+    failed = sum(result["error"] is not None for result in outcomes.values()) - timed_out
+    print(f"Batch complete: {len(outcomes) - failed - timed_out} succeeded, {failed} failed, {timed_out} timed out")
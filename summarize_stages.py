@@ -0,0 +1,63 @@
+from utils.StageRecorder import STAGE_FILE, load_stage_events
+import pandas as pd
+import argparse
+
+
+def summarize_stages(events: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates stage events per stage, hottest stage first.
+
+    Args:
+        events (pd.DataFrame): Stage events, as returned by load_stage_events.
+
+    Returns:
+        pd.DataFrame: Per stage, the number of runs and events, total/mean/median/max seconds, the share of
+            all recorded time, throughput in rows per second (where rows were recorded) and, where memory was
+            sampled, the largest process-tree RSS seen during the stage.
+    """
+    grouped = events.groupby("stage")
+    summary = pd.DataFrame({
+        "runs": grouped["run"].nunique(),
+        "events": grouped.size(),
+        "total_s": grouped["duration_s"].sum(),
+        "mean_s": grouped["duration_s"].mean(),
+        "median_s": grouped["duration_s"].median(),
+        "max_s": grouped["duration_s"].max(),
+    })
+    summary["share_%"] = 100 * summary["total_s"] / summary["total_s"].sum()
+
+    with_rows = events.dropna(subset=["rows"]).groupby("stage")
+    summary["rows_per_s"] = with_rows["rows"].sum() / with_rows["duration_s"].sum()
+    # process_peak_rss_mb is the worker's lifetime peak, which says nothing about a single stage
+    if "tree_rss_peak_mb" in events:
+        summary["tree_rss_peak_mb"] = grouped["tree_rss_peak_mb"].max()
+
+    return summary.sort_values("total_s", ascending=False)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Report where the time of a batch of MED regressions went.")
+    parser.add_argument("--root", default="med_post", help="Batch output folder to read stage timings from.")
+    parser.add_argument("--slowest", type=int, default=5, help="Number of slowest runs to list.")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    events = load_stage_events(args.root)
+    if events.empty:
+        print(f"No {STAGE_FILE} files found under '{args.root}'")
+        raise SystemExit(1)
+
+    pd.set_option("display.width", 160)
+    print(f"{events['run'].nunique()} runs, {len(events)} stage events, {events['duration_s'].sum():.1f}s recorded")
+    print()
+    print(summarize_stages(events).round(3).to_string())
+
+    print()
+    print("Slowest runs:")
+    per_run = events.pivot_table(index="run", columns="stage", values="duration_s", aggfunc="sum")
+    per_run.insert(0, "total_s", per_run.sum(axis=1))
+    print(per_run.sort_values("total_s", ascending=False).head(args.slowest).round(2).to_string())
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+
+class BatchManifest:
+    def __init__(self, path: str, entries: dict[str, dict] | None = None):
+        """
+        Initialises the BatchManifest, the on-disk record of each regression's state in a batch.
+
+        Args:
+            path (str): The path of the JSON file the manifest is saved to.
+            entries (dict[str, dict], optional): Existing entries keyed by run key (Default: empty).
+        """
+        self.path = path
+        self.entries = entries if entries is not None else {}
+
+
+    @classmethod
+    def load(cls, path: str) -> "BatchManifest":
+        """
+        Loads a manifest from disk, or returns an empty one if the file does not exist.
+
+        Args:
+            path (str): The path of the manifest JSON file.
+
+        Returns:
+            BatchManifest: The loaded manifest.
+        """
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as f:
+            data = json.load(f)
+
+        return cls(path, data.get("runs", {}))
+
+
+    def save(self):
+        """
+        Writes the manifest to disk atomically, so an interrupted batch never leaves a truncated file.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"updated": time.time(), "runs": self.entries}, f, indent=4, default=str)
+
+        os.replace(tmp_path, self.path)
+
+
+    def add(self, key: str, **fields):
+        """
+        Registers a regression as pending, keeping the existing entry if the key is already known.
+
+        Args:
+            key (str): The run key of the regression.
+            **fields: Descriptive fields stored with a new entry (output path, parameters, seed, ...).
+        """
+        if key not in self.entries:
+            self.entries[key] = {"state": PENDING, "attempts": 0, **fields}
+
+
+    def update(self, key: str, state: str, **fields):
+        """
+        Records a state change for a regression and saves the manifest.
+
+        Args:
+            key (str): The run key of the regression.
+            state (str): One of PENDING, RUNNING, DONE or FAILED.
+            **fields: Extra fields to store on the entry (timings, error, ...).
+        """
+        entry = self.entries.setdefault(key, {"attempts": 0})
+        entry["state"] = state
+        entry.update(fields)
+
+        if state == RUNNING:
+            entry["attempts"] = entry.get("attempts", 0) + 1
+
+        self.save()
+
+
+    def is_done(self, key: str) -> bool:
+        """
+        Checks whether a regression finished successfully in a previous (or this) batch.
+        """
+        return self.entries.get(key, {}).get("state") == DONE
+
+
+    def counts(self) -> dict[str, int]:
+        """
+        Counts the regressions in each state.
+
+        Returns:
+            dict[str, int]: The number of entries per state.
+        """
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0, TIMEOUT: 0}
+        for entry in self.entries.values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+
+        return counts
@@ -0,0 +1,169 @@
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .proc_utils import tree_rss_bytes
+
+
+# Stages whose throughput is exported as the evaluation rate
+EVALUATION_STAGES = ("evaluate",)
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class BatchMetrics:
+    def __init__(self, n_jobs: int):
+        """
+        Initialises the BatchMetrics, the counters and gauges of a running batch in Prometheus terms.
+
+        Args:
+            n_jobs (int): The number of regressions in the batch.
+        """
+        self.n_jobs = n_jobs
+        self.started = time.time()
+        self.queued = n_jobs
+        self.running = 0
+        self.finished = {}  # state -> count
+        self.run_seconds = {}  # state -> summed duration
+        self.stage_seconds = {}
+        self.stage_counts = {}
+        self.stage_rows = {}
+        self.last_evaluation_rate = None
+        self._lock = threading.Lock()
+
+
+    def start(self):
+        """Counts a regression as started."""
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+
+
+    def finish(self, state: str, result: dict):
+        """
+        Counts a regression as finished.
+
+        Args:
+            state (str): Its manifest state, e.g. "done", "failed" or "timeout".
+            result (dict): Its result from run_job.
+        """
+        with self._lock:
+            self.running -= 1
+            self.finished[state] = self.finished.get(state, 0) + 1
+            self.run_seconds[state] = self.run_seconds.get(state, 0.0) + result["duration_s"]
+
+            for stage, seconds in (result.get("stages") or {}).items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+                self.stage_counts[stage] = self.stage_counts.get(stage, 0) + 1
+
+            rows = result.get("rows") or {}
+            for stage, stage_rows in rows.items():
+                self.stage_rows[stage] = self.stage_rows.get(stage, 0) + stage_rows
+
+            evaluated = sum(rows.get(stage, 0) for stage in EVALUATION_STAGES)
+            evaluation_s = sum((result.get("stages") or {}).get(stage, 0.0) for stage in EVALUATION_STAGES)
+            if evaluated and evaluation_s > 0:
+                self.last_evaluation_rate = evaluated / evaluation_s
+
+
+    def render(self) -> str:
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(**labels)} {value}")
+
+        with self._lock:
+            metric("med_batch_jobs", "gauge", "Regressions in the batch.", [({}, self.n_jobs)])
+            metric("med_batch_uptime_seconds", "gauge", "Seconds since the batch started.", [({}, time.time() - self.started)])
+            metric("med_runs_queued", "gauge", "Regressions waiting to start.", [({}, self.queued)])
+            metric("med_runs_running", "gauge", "Regressions running now.", [({}, self.running)])
+            metric(
+                "med_runs_total", "counter", "Regressions finished, by final state.",
+                [({"state": state}, count) for state, count in sorted(self.finished.items())]
+            )
+            metric(
+                "med_run_duration_seconds_total", "counter", "Summed wall time of finished regressions, by final state.",
+                [({"state": state}, seconds) for state, seconds in sorted(self.run_seconds.items())]
+            )
+            metric(
+                "med_stage_duration_seconds_total", "counter", "Summed wall time of each stage over finished regressions.",
+                [({"stage": stage}, seconds) for stage, seconds in sorted(self.stage_seconds.items())]
+            )
+            metric(
+                "med_stage_runs_total", "counter", "Finished regressions that went through each stage.",
+                [({"stage": stage}, count) for stage, count in sorted(self.stage_counts.items())]
+            )
+            metric(
+                "med_stage_rows_total", "counter", "Rows handled by each stage over finished regressions.",
+                [({"stage": stage}, rows) for stage, rows in sorted(self.stage_rows.items())]
+            )
+            if self.last_evaluation_rate is not None:
+                metric(
+                    "med_evaluation_rows_per_second", "gauge", "Equation evaluation throughput of the last finished regression.",
+                    [({}, self.last_evaluation_rate)]
+                )
+
+        rss = tree_rss_bytes(os.getpid())
+        if rss is not None:
+            metric("med_batch_rss_bytes", "gauge", "Resident memory of the batch driver and all of its workers.", [({}, rss)])
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, metrics: BatchMetrics, port: int, host: str = "127.0.0.1"):
+        """
+        Initialises the MetricsServer, which serves metrics.render() at /metrics from a background thread.
+
+        Args:
+            metrics (BatchMetrics): The metrics to serve.
+            port (int): The port to listen on (0 picks a free one, see self.port).
+            host (str): The address to listen on (Default: "127.0.0.1", local only).
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes would otherwise flood the batch output
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+
+    def start(self) -> "MetricsServer":
+        """Starts serving, returning the server."""
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+from .StageRecorder import load_stage_events
+
+
+# Durations of finished regressions that went through discovery are appended to this file in the
+# batch output folder. Unlike a run's stage timings, it survives the run being rerun from its cache
+HISTORY_FILE = "run_durations.jsonl"
+
+
+def past_run_durations(root: str) -> pd.DataFrame:
+    """
+    Collects the durations of previous regressions from the run history (see HISTORY_FILE) and
+    from the stage timings of runs missing from it.
+
+    Only runs that went through discovery are kept, as runs reusing a cached discovery say
+    nothing about how long a new one takes.
+
+    Args:
+        root (str): The batch output folder, holding the run history and searched recursively for
+            stage_timings.jsonl files.
+
+    Returns:
+        pd.DataFrame: One row per past run, with "n_params", "rows" (input rows, NaN if unknown) and "duration_s".
+    """
+    columns = ["n_params", "rows", "duration_s"]
+
+    history = pd.DataFrame(columns=["run", *columns])
+    history_path = os.path.join(root, HISTORY_FILE)
+    if os.path.exists(history_path):
+        with open(history_path) as f:
+            history = pd.DataFrame([json.loads(line) for line in f if line.strip()], columns=["run", *columns])
+
+    runs = pd.DataFrame(columns=["run", *columns])
+    events = load_stage_events(root)
+    if not events.empty and "n_params" in events:
+        grouped = events.groupby("run")
+        runs = pd.DataFrame({
+            "n_params": grouped["n_params"].first(),
+            "rows": grouped["rows"].max(),
+            "duration_s": grouped["duration_s"].sum(),
+            "discovered": grouped["stage"].agg(lambda stages: "discover" in set(stages))
+        })
+        runs = runs[runs["discovered"]].drop(columns="discovered").reset_index()
+        runs = runs[~runs["run"].isin(history["run"])]
+
+    frames = [frame[columns] for frame in (history, runs) if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(frames, ignore_index=True).astype(float)
+
+
+def estimate_duration(history: pd.DataFrame, n_params: int, rows: int | None = None) -> float | None:
+    """
+    Estimates how long a regression will take from past runs with the same number of parameters
+    and, where known, a similar number of rows (within a factor of two).
+
+    Args:
+        history (pd.DataFrame): Past runs, as returned by past_run_durations.
+        n_params (int): The number of parameters of the regression.
+        rows (int, optional): The number of input rows of the regression.
+
+    Returns:
+        float | None: The median duration of the most similar past runs in seconds, or None without any.
+    """
+    if history.empty:
+        return None
+
+    similar = history[history["n_params"] == n_params]
+    if similar.empty:
+        similar = history
+
+    if rows:
+        close = similar[(similar["rows"] >= rows / 2) & (similar["rows"] <= rows * 2)]
+        if not close.empty:
+            similar = close
+
+    return float(similar["duration_s"].median())
+
+
+def format_seconds(seconds: float | None) -> str:
+    """
+    Formats a duration as e.g. 1h02m, 3m05s or 12s.
+    """
+    if seconds is None or not np.isfinite(seconds):
+        return "?"
+
+    seconds = int(round(seconds))
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+
+    return f"{seconds}s"
+
+
+class BatchProgress:
+    def __init__(
+            self,
+            jobs: list[dict],
+            n_workers: int = 1,
+            history: pd.DataFrame | None = None,
+            n_rows: int | None = None,
+            history_path: str | None = None
+        ):
+        """
+        Initialises the BatchProgress, which follows a running batch and estimates when it will finish.
+
+        Each job's duration is estimated from past runs with the same parameter count and a similar
+        row count (see estimate_duration), and from the runs of this batch as they finish.
+
+        Args:
+            jobs (list[dict]): The batch's jobs (keyword arguments for run_med_processor).
+            n_workers (int): Number of regressions run at once (Default: 1).
+            history (pd.DataFrame, optional): Past runs, as returned by past_run_durations.
+            n_rows (int, optional): Number of input rows of each regression, if known.
+            history_path (str, optional): File to append the duration of each run that went through discovery
+                to, for the ETA of later batches (see HISTORY_FILE).
+        """
+        self.jobs = jobs
+        self.n_workers = max(n_workers, 1)
+        self.history = history if history is not None else pd.DataFrame(columns=["n_params", "rows", "duration_s"])
+        self.n_rows = n_rows
+        self.history_path = history_path
+        self.queued = set(range(len(jobs)))
+        self.running = {}  # job index -> start time
+        self.done = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.batch_started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ticker = None
+
+
+    def start(self, index: int):
+        """Marks a job as running."""
+        with self._lock:
+            self.queued.discard(index)
+            self.running[index] = time.time()
+
+
+    def finish(self, index: int, result: dict):
+        """Marks a job as finished with the result of run_job (a timeout if the watchdog stopped it, a failure if it has an error)."""
+        with self._lock:
+            self.running.pop(index, None)
+            if result["error"] is None:
+                self.done += 1
+                # This batch's own runs are the best guide to its remaining ones, except those that
+                # reused a cached discovery and took a fraction of the time a new one does
+                if "discover" not in (result.get("stages") or {}):
+                    return
+                run = {
+                    "n_params": len(self.jobs[index]["param_list"]), "rows": self.n_rows, "duration_s": result["duration_s"]
+                }
+                if self.history_path is not None:
+                    self._append_history(index, run)
+
+                finished = pd.DataFrame([run])
+                self.history = finished if self.history.empty else pd.concat([self.history, finished], ignore_index=True)
+            elif result.get("timeout") is not None:
+                self.timed_out += 1
+            else:
+                self.failed += 1
+
+
+    def _append_history(self, index: int, run: dict):
+        directory = os.path.dirname(self.history_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        folder = self.jobs[index].get("folder_save_path")
+        with open(self.history_path, "a") as f:
+            f.write(json.dumps({"run": os.path.basename(folder) if folder else None, **run}) + "\n")
+
+
+    def eta(self) -> float | None:
+        """
+        Estimates the seconds until the batch finishes, or None without anything to estimate from.
+        """
+        with self._lock:
+            def estimate(index):
+                return estimate_duration(self.history, len(self.jobs[index]["param_list"]), self.n_rows)
+
+            remaining = [estimate(index) for index in self.queued]
+            for index, started in self.running.items():
+                expected = estimate(index)
+                remaining.append(None if expected is None else max(expected - (time.time() - started), 0.0))
+
+        if not remaining:
+            return 0.0
+        if any(seconds is None for seconds in remaining):
+            return None
+
+        return sum(remaining) / min(self.n_workers, len(remaining))
+
+
+    def line(self) -> str:
+        """
+        Describes the state of the batch in one line.
+        """
+        total = len(self.jobs)
+        eta = self.eta()
+
+        with self._lock:
+            finished = self.done + self.failed + self.timed_out
+            queued = len(self.queued)
+            running = ", ".join(
+                f"#{index + 1} {format_seconds(time.time() - started)}" for index, started in sorted(self.running.items())
+            )
+
+        return (
+            f"[{finished}/{total} ({100 * finished / total:.1f}%) | running {len(self.running)} | queued {queued} | "
+            f"done {self.done} | failed {self.failed} | timed out {self.timed_out}] "
+            + (f"running: {running} | " if running else "")
+            + f"elapsed {format_seconds(time.time() - self.batch_started)}, ETA {format_seconds(eta)}"
+        )
+
+
+    def start_ticker(self, interval: float):
+        """
+        Prints the progress line every interval seconds from a background thread, until stop_ticker is called.
+        """
+        def tick():
+            while not self._stop.wait(interval):
+                print(self.line(), flush=True)
+
+        self._ticker = threading.Thread(target=tick, name="batch-progress", daemon=True)
+        self._ticker.start()
+
+
+    def stop_ticker(self):
+        """Stops the background progress line."""
+        if self._ticker is not None:
+            self._stop.set()
+            self._ticker.join()
+            self._ticker = None
@@ -1,20 +1,198 @@
+import os
+import glob
+import json
+import copy
+import time
+import shutil
+import tempfile
 import numpy as np
 import pandas as pd
 import medeq
-from .general_utils import create_function, split_df
+from .SharedFrame import SharedFrame
+from .StageRecorder import StageRecorder
+from .general_utils import create_fused_function, hash_uniform, split_indices, kfold_indices, subsample_indices, aggregate_duplicate_rows, take_columns, isolated_tempdir, find_hof_file, move_hof_file, hash_fields
+
+
+# Seed passed to medeq.MED, and the settings passed to med.discover
+MED_SEED = 200
+DISCOVERY_SETTINGS = {
+    "binary_operators": ["+", "-", "*", "/", "^"],
+    "constraints": {"^": (-1, 1)},  # (-1, 1) is the encoded constraint for "^" operator
+    "unary_operators": ["exp", "log"]
+}
+
+# PySR search-budget settings that can be passed through med.discover
+SEARCH_SETTING_NAMES = (
+    "niterations", "populations", "population_size", "batching", "batch_size", "maxsize", "timeout_in_seconds"
+)
+
+# Named search budgets layered over DISCOVERY_SETTINGS, trading accuracy for time
+SEARCH_BUDGETS = {
+    "smoke": {"niterations": 2, "populations": 4, "population_size": 20, "maxsize": 12, "timeout_in_seconds": 120},
+    "fast": {"niterations": 15, "populations": 8, "population_size": 30, "batching": True, "batch_size": 50, "maxsize": 20},
+    "balanced": {"niterations": 40, "populations": 15, "population_size": 33, "batching": True, "batch_size": 200, "maxsize": 25},
+    "thorough": {"niterations": 200, "populations": 30, "population_size": 50, "batching": False, "maxsize": 30},
+}
+
+# Search settings layered over DISCOVERY_SETTINGS for the warm-up run, kept as small as possible
+WARM_UP_SETTINGS = {"niterations": 1, "populations": 1}
+
+# Row selection recorded in the results folder when training data is subsampled before discovery
+SUBSAMPLE_FILE = "train_subsample.csv"
+
+# Test rows spooled to the results folder by prepare_data_streaming
+TEST_SPOOL_FILE = "test_spool.csv"
+
+# Written to the results folder once discovery has completed, marking the run as reusable
+RUN_INFO_FILE = "run_info.json"
+AGGREGATION_FILE = "train_aggregation.json"
+PARTIAL_HOF_FILE = "hall_of_fame_partial.csv"
+
+
+def build_discovery_settings(budget: str | None = None, **search_settings) -> dict:
+    """
+    Builds the settings passed to med.discover from DISCOVERY_SETTINGS, a named search budget and explicit overrides.
+
+    Args:
+        budget (str, optional): One of SEARCH_BUDGETS ("smoke", "fast", "balanced", "thorough").
+        **search_settings: Explicit values of the SEARCH_SETTING_NAMES, overriding the budget. None values are ignored.
+
+    Returns:
+        dict: The discovery settings.
+    """
+    if budget is not None and budget not in SEARCH_BUDGETS:
+        raise ValueError(f"Unknown search budget '{budget}', expected one of {list(SEARCH_BUDGETS)}")
+
+    unknown = [name for name in search_settings if name not in SEARCH_SETTING_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown search settings {unknown}, expected some of {list(SEARCH_SETTING_NAMES)}")
+
+    settings = copy.deepcopy(DISCOVERY_SETTINGS)
+    if budget is not None:
+        settings.update(SEARCH_BUDGETS[budget])
+    settings.update({name: value for name, value in search_settings.items() if value is not None})
+
+    return settings
+
+
+def run_key(
+        data_digest: str,
+        param_names: list[str],
+        target: str,
+        split_seed: int,
+        split_frac: float,
+        discovery_settings: dict | None = None,
+        float32: bool = False,
+        **options
+    ) -> str:
+    """
+    Computes the content hash identifying a MED regression.
+
+    Two runs with the same key train on the same data with the same search settings, so the
+    discovered equations of one can be reused for the other.
+
+    Args:
+        data_digest (str): Hash of the input CSV contents (see general_utils.file_digest).
+        param_names (list[str]): Parameter column names.
+        target (str): Target column name.
+        split_seed (int): Random seed used for the train-test split.
+        split_frac (float): Fraction of data used for training.
+        discovery_settings (dict, optional): Settings passed to med.discover (Default: DISCOVERY_SETTINGS).
+        float32 (bool): Whether the data was downcast to float32 before training (Default: False).
+        **options: Further settings that change what is trained on, e.g. cross_validation (the K-fold
+            "n_folds" and "n_repeats"), split_method or max_train_rows. Options set to None are left out.
+
+    Returns:
+        str: A hex digest.
+    """
+    # Only tag downcast data and options that are set, so keys of runs without them stay the same
+    data = f"{data_digest}:float32" if float32 else data_digest
+    extra = {name: value for name, value in options.items() if value is not None}
+    split_method = extra.pop("split_method", None) or "rng-permutation"
+
+    return hash_fields(
+        **extra,
+        data=data,
+        param_names=list(param_names),
+        target=target,
+        split_seed=split_seed,
+        split_frac=split_frac,
+        med_seed=MED_SEED,
+        split_method=split_method,  # Discoveries made on splits drawn another way are not reused
+        discovery=discovery_settings if discovery_settings is not None else DISCOVERY_SETTINGS
+    )
+
+
+def salvage_partial_hof(folder: str) -> list[str]:
+    """
+    Keeps the hall of fame of a discovery that was stopped before it finished.
+
+    PySR rewrites hall_of_fame.csv as the search progresses, so a stopped run leaves the best
+    equations found so far in its working directory. Each one found under folder is moved next to
+    its working directory as hall_of_fame_partial.csv. Partial results never mark a run as complete.
+
+    Args:
+        folder (str): The results folder of the run (cross-validation folds are searched too).
+
+    Returns:
+        list[str]: The paths of the salvaged files.
+    """
+    salvaged = []
+    for work_dir in sorted(glob.glob(os.path.join(folder, "**", "_work"), recursive=True)):
+        hof_files = glob.glob(os.path.join(work_dir, "**", "hall_of_fame.csv"), recursive=True)
+        if not hof_files:
+            continue
+
+        dest = os.path.join(os.path.dirname(work_dir), PARTIAL_HOF_FILE)
+        shutil.move(max(hof_files, key=os.path.getmtime), dest)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        salvaged.append(dest)
+
+    return salvaged
 
 
 class MEDProcessor:
-    def __init__(self, param_names: list[str], df: pd.DataFrame, target: str, folder_save_name="med_study"):
+    def __init__(
+            self,
+            param_names: list[str],
+            df: pd.DataFrame | SharedFrame,
+            target: str,
+            folder_save_name="med_study",
+            discovery_settings: dict | None = None,
+            backend: str = "numpy",
+            data_key: str | None = None,
+            max_train_rows: int | None = None,
+            subsample_method: str = "maximin",
+            aggregate_duplicates: bool = False,
+            n_threads: int | None = None,
+            recorder: StageRecorder | None = None
+        ):
         """
         Initialises the MEDProcessor
 
         Args:
             param_names (list[str]): List of parameter names (column names) to use as inputs.
-            df (pd.DataFrame): The DataFrame containing the columns of parameter values and associated target value
+            df (pd.DataFrame | SharedFrame): The DataFrame containing the columns of parameter values and associated target value.
+                A SharedFrame is used through a zero-copy DataFrame view
             target (str): The name of the column containing target value within df
             folder_save_name (str): The name of the folder to be created that will contain med results (Default: "med_study")
+            discovery_settings (dict, optional): Settings passed to med.discover (Default: DISCOVERY_SETTINGS)
+            backend (str): Equation evaluation backend used by test_equations: "numpy", "numexpr" or "numba" (Default: "numpy")
+            data_key (str, optional): Identifies df (e.g. its content hash), letting processors on the same data share splits
+            max_train_rows (int, optional): Subsample training sets larger than this before discovery (Default: no subsampling)
+            subsample_method (str): How training rows are subsampled: "maximin", "grid" or "random" (Default: "maximin")
+            aggregate_duplicates (bool): Collapse training rows with identical parameters into one row with the
+                mean target before discovery (Default: False)
+            n_threads (int, optional): Number of parallel PySR workers (procs) used by discovery, matching the
+                threads Julia was started with (Default: PySR's own default)
+            recorder (StageRecorder, optional): Times each stage of the processor's work (Default: a recorder
+                keeping its events in memory only)
         """
+        # Keep the SharedFrame referenced for as long as its DataFrame view is in use
+        self.shared_frame = df if isinstance(df, SharedFrame) else None
+        if self.shared_frame is not None:
+            df = self.shared_frame.to_dataframe()
+
         # Validation: ensure all param_names are in df columns
         missing = [p for p in param_names if p not in df.columns]
         if missing:
@@ -24,12 +202,28 @@ class MEDProcessor:
         self.target = target
         self.folder_save_name = folder_save_name
         self.param_names = param_names
+        self.work_dir = os.path.join(folder_save_name, "_work")
+        self.backend = backend
+        self.data_key = data_key
+        self.train_idx = None
+        self.test_idx = None
+        self.max_train_rows = max_train_rows
+        self.subsample_method = subsample_method
+        self.train_subsample_idx = None
+        self.aggregate_duplicates = aggregate_duplicates
+        self.train_weights = None
+        self.n_threads = n_threads
+        self.recorder = recorder if recorder is not None else StageRecorder()
+        self.discovery_settings = copy.deepcopy(discovery_settings if discovery_settings is not None else DISCOVERY_SETTINGS)
 
 
     def prepare_data(self, split_frac: float, seed=42) -> tuple[pd.DataFrame, pd.DataFrame, dict[str, list]]:
         """
         Prepares input data for MED.
 
+        The split is drawn as row positions (kept as train_idx and test_idx), and only the parameter
+        and target columns are gathered into the train and test DataFrames.
+
         Args:
             split_frac (float): Fraction of data to use for training.
             seed (int): Random seed for reproducibility.
@@ -37,8 +231,68 @@ class MEDProcessor:
         Returns:
             tuple: (train_df, test_df, parameters)
         """
-        train_df, test_df = split_df(self.df, split_frac, seed)
+        with self.recorder.stage("prepare_data", rows=len(self.df)):
+            self.train_idx, self.test_idx = split_indices(len(self.df), split_frac, seed, self.data_key)
+
+            columns = [*self.param_names, self.target]
+            train_df = take_columns(self.df, columns, self.train_idx)
+            test_df = take_columns(self.df, columns, self.test_idx)
+
+            parameters = self._parameter_bounds()
+
+        return train_df, test_df, parameters
+
+
+    def prepare_folds(self, n_folds: int, seed=42, n_repeats=1) -> tuple[list[dict], dict[str, list]]:
+        """
+        Prepares input data for (repeated) K-fold cross-validation with MED.
+
+        Each repeat shuffles the rows once and cuts the permutation into n_folds held-out sets. Only
+        the row positions are drawn here; a fold's train and test DataFrames are gathered with
+        fold_frames when it is run, so only one fold's copy of the data exists at a time.
+
+        Args:
+            n_folds (int): Number of folds per repeat.
+            seed (int): Random seed for reproducibility.
+            n_repeats (int): Number of times the K-fold split is repeated with a new shuffle (Default: 1).
+
+        Returns:
+            tuple: (folds, parameters), where each fold is a dict with "repeat", "fold", "train_idx" and "test_idx".
+        """
+        with self.recorder.stage("prepare_data", rows=len(self.df)):
+            folds = [
+                {"repeat": repeat, "fold": fold, "train_idx": train_idx, "test_idx": test_idx}
+                for repeat, fold, train_idx, test_idx in kfold_indices(len(self.df), n_folds, seed, n_repeats)
+            ]
+
+            parameters = self._parameter_bounds()
+
+        return folds, parameters
+
+
+    def fold_frames(self, fold: dict, train: bool = True) -> tuple[pd.DataFrame | None, pd.DataFrame]:
+        """
+        Gathers the parameter and target columns of a fold's rows.
+
+        Args:
+            fold (dict): A fold, as returned by prepare_folds.
+            train (bool): Whether to gather the training rows too, which are not needed when the fold's
+                discovery is cached (Default: True).
 
+        Returns:
+            tuple: (train_df, test_df), where train_df is None without train.
+        """
+        columns = [*self.param_names, self.target]
+        rows = len(fold["test_idx"]) + (len(fold["train_idx"]) if train else 0)
+
+        with self.recorder.stage("prepare_data", rows=rows):
+            train_df = take_columns(self.df, columns, fold["train_idx"]) if train else None
+            test_df = take_columns(self.df, columns, fold["test_idx"])
+
+        return train_df, test_df
+
+
+    def _parameter_bounds(self) -> dict[str, list]:
         minimums = [self.df[param].min() for param in self.param_names]
         maximums = [self.df[param].max() for param in self.param_names]
 
@@ -48,88 +302,417 @@ class MEDProcessor:
             "maximums": maximums
         }
 
-        return train_df, test_df, parameters
+        return parameters
 
 
-    def run_med_discovery(self, train_df: pd.DataFrame, parameters: dict):
+    def prepare_data_streaming(
+            self,
+            csv_path: str,
+            split_frac: float,
+            seed=42,
+            chunksize=100_000,
+            max_train_rows: int | None = None
+        ) -> tuple[pd.DataFrame, str, dict[str, list]]:
+        """
+        Prepares input data for MED by streaming the CSV in chunks, for inputs larger than memory.
+
+        One pass over the file computes the parameter bounds and assigns each row to the train or
+        test split by a seeded hash of its row number, so the split does not depend on the chunk
+        size. Test rows are spooled to test_spool.csv in the results folder for evaluation with
+        test_equations_streaming. Train rows are kept in memory. With max_train_rows, only a uniform
+        random sample of that many train rows is kept (the rows with the smallest second hash), so
+        memory stays bounded whatever the file size.
+
+        Args:
+            csv_path (str): The path of the CSV holding the data.
+            split_frac (float): Fraction of data to use for training.
+            seed (int): Random seed for reproducibility.
+            chunksize (int): Number of rows read at a time (Default: 100000).
+            max_train_rows (int, optional): Maximum number of train rows kept (Default: all).
+
+        Returns:
+            tuple: (train_df, test_spool_path, parameters)
+        """
+        columns = [*self.param_names, self.target]
+        os.makedirs(self.folder_save_name, exist_ok=True)
+        spool_path = os.path.join(self.folder_save_name, TEST_SPOOL_FILE)
+
+        with self.recorder.stage("prepare_data") as event:
+            minimums = np.full(len(self.param_names), np.inf)
+            maximums = np.full(len(self.param_names), -np.inf)
+            train_chunks, train_priorities = [], []
+            start = 0
+
+            for chunk in pd.read_csv(csv_path, usecols=columns, chunksize=chunksize):
+                chunk = chunk[columns].reset_index(drop=True)
+                positions = np.arange(start, start + len(chunk))
+                start += len(chunk)
+
+                params = chunk[self.param_names].to_numpy(dtype=float)
+                minimums = np.fmin(minimums, params.min(axis=0, initial=np.inf))
+                maximums = np.fmax(maximums, params.max(axis=0, initial=-np.inf))
+
+                is_train = hash_uniform(positions, seed) < split_frac
+
+                chunk[~is_train].to_csv(spool_path, mode="w" if positions[0] == 0 else "a", header=positions[0] == 0, index=False)
+
+                train_chunks.append(chunk[is_train])
+                train_priorities.append(hash_uniform(positions[is_train], seed + 1))
+
+                # Keep only the max_train_rows train rows with the smallest priority seen so far
+                if max_train_rows is not None and sum(map(len, train_chunks)) > max_train_rows:
+                    train = pd.concat(train_chunks, ignore_index=True)
+                    priorities = np.concatenate(train_priorities)
+                    keep = np.sort(np.argpartition(priorities, max_train_rows)[:max_train_rows])
+                    train_chunks, train_priorities = [train.iloc[keep]], [priorities[keep]]
+
+            train_df = pd.concat(train_chunks, ignore_index=True) if train_chunks else pd.DataFrame(columns=columns)
+            event["rows"] = start
+
+        parameters = {
+            "names": self.param_names,
+            "minimums": minimums.tolist(),
+            "maximums": maximums.tolist()
+        }
+
+        return train_df, spool_path, parameters
+
+
+    def test_equations_streaming(
+            self,
+            test_path: str,
+            tmp_path=None,
+            backend: str | None = None,
+            chunksize=100_000,
+            out_path: str | None = None
+        ) -> str:
+        """
+        Tests MED results on a test set read from a CSV in chunks, writing the relative errors as it goes.
+
+        The output has the same columns as test_equations, but rows stay in file order rather than
+        being sorted by parameter, as sorting would need the whole test set in memory.
+
+        Args:
+            test_path (str): The path of the test CSV, e.g. the spool written by prepare_data_streaming.
+            tmp_path (str, optional): Path to MED result CSV file.
+            backend (str, optional): Equation evaluation backend, overriding the one set on the processor.
+            chunksize (int): Number of rows evaluated at a time (Default: 100000).
+            out_path (str, optional): Where to write the results (Default: med_unseen.csv in the results folder).
+
+        Returns:
+            str: The path of the results CSV.
+        """
+        eq_path = tmp_path if tmp_path else f"{self.folder_save_name}/hall_of_fame.csv"
+        with self.recorder.stage("compile_equations"):
+            df_equations = pd.read_csv(eq_path)
+            fused_func = create_fused_function(
+                list(df_equations["Equation"]), *self.param_names, backend=backend or self.backend
+            )
+
+        out_path = out_path or os.path.join(self.folder_save_name, "med_unseen.csv")
+        start = 0
+
+        # Reading, evaluating and writing are interleaved chunk by chunk, so they are timed as one stage
+        with self.recorder.stage("evaluate") as event:
+            for chunk in pd.read_csv(test_path, chunksize=chunksize):
+                df_results = self._evaluate_equations(chunk, df_equations["Complexity"], fused_func)
+                df_results.index += start
+
+                df_results.to_csv(out_path, mode="w" if start == 0 else "a", header=start == 0)
+                start += len(chunk)
+
+            event["rows"] = start
+
+        return out_path
+
+
+    def _aggregate_training(self, train_df: pd.DataFrame, parameters: dict, folder: str) -> pd.DataFrame:
+        aggregated, stats = aggregate_duplicate_rows(train_df, parameters["names"], self.target)
+        self.train_weights = aggregated.pop("weight").to_numpy()
+
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, AGGREGATION_FILE), "w") as f:
+            json.dump(stats, f, indent=4)
+
+        print(
+            f"Aggregated training data from {stats['rows']} to {stats['unique_rows']} unique rows "
+            f"({100 * stats['duplicate_fraction']:.1f}% duplicates, largest group {stats['max_weight']}, "
+            f"mean target std within groups {stats['mean_target_std']:.3g})"
+        )
+
+        return aggregated
+
+
+    def _subsample_training(
+            self,
+            train_df: pd.DataFrame,
+            parameters: dict,
+            folder: str,
+            train_rows: np.ndarray | None
+        ) -> pd.DataFrame:
+        selected = subsample_indices(
+            train_df[parameters["names"]].to_numpy(dtype=float),
+            self.max_train_rows,
+            parameters["minimums"],
+            parameters["maximums"],
+            method=self.subsample_method
+        )
+        self.train_subsample_idx = selected
+
+        record = {"train_position": selected}
+        if train_rows is not None:
+            record["data_row"] = np.asarray(train_rows)[selected]
+
+        os.makedirs(folder, exist_ok=True)
+        pd.DataFrame(record).to_csv(os.path.join(folder, SUBSAMPLE_FILE), index=False)
+        print(f"Subsampled training data from {len(train_df)} to {len(selected)} rows ({self.subsample_method})")
+
+        return train_df.iloc[selected].reset_index(drop=True)
+
+
+    def has_cached_discovery(self, key: str, folder: str | None = None) -> bool:
+        """
+        Checks whether the results folder holds a completed discovery for the given run key.
+
+        Args:
+            key (str): The run key (see run_key).
+            folder (str, optional): The folder to check (Default: the results folder).
+
+        Returns:
+            bool: True if the hall_of_fame.csv of a completed run with the same key exists.
+        """
+        folder = folder or self.folder_save_name
+        info_path = os.path.join(folder, RUN_INFO_FILE)
+        hof_path = os.path.join(folder, "hall_of_fame.csv")
+
+        if not (os.path.exists(info_path) and os.path.exists(hof_path)):
+            return False
+
+        try:
+            with open(info_path) as f:
+                return json.load(f).get("run_key") == key
+        except (OSError, ValueError):
+            return False
+
+
+    def run_med_discovery(
+            self,
+            train_df: pd.DataFrame,
+            parameters: dict,
+            run_info: dict | None = None,
+            folder: str | None = None,
+            train_rows: np.ndarray | None = None,
+            search_settings: dict | None = None
+        ) -> bool:
         """
         Runs MED symbolic regression to discover equations.
 
+        The search runs with its temporary files redirected into a private working directory
+        inside the results folder, and the hall_of_fame.csv it produces is moved into the
+        results folder once discovery has finished.
+
+        If the processor has aggregate_duplicates set, training rows with identical parameters are first
+        collapsed into one row with their mean target. The number of rows behind each one is kept in
+        train_weights and the aggregation statistics are written to train_aggregation.json.
+
+        If the processor has max_train_rows set and train_df is larger, discovery only sees a
+        space-filling subset of the training rows. The selection is kept in train_subsample_idx and
+        written to train_subsample.csv in the results folder.
+
         Args:
             train_df (pd.DataFrame): Training dataset with labelled data points.
             parameters (dict): Dictionary containing parameter names and bounds.
+            run_info (dict, optional): Written to run_info.json once the hall of fame is captured,
+                marking the run as complete. Include "run_key" to make it reusable by has_cached_discovery.
+            folder (str, optional): The folder MED results are saved to (Default: the results folder).
+            train_rows (np.ndarray, optional): The row of df each train_df row came from, recorded with a subsample.
+            search_settings (dict, optional): Settings layered over the processor's discovery_settings for this call only,
+                e.g. {"niterations": 10, "batching": True} (see SEARCH_SETTING_NAMES).
+
+        Returns:
+            bool: True if the hall_of_fame.csv was captured, False otherwise.
         """
+        folder = folder or self.folder_save_name
+        work_dir = self.work_dir if folder == self.folder_save_name else os.path.join(folder, "_work")
+
+        self.train_subsample_idx = None
+        self.train_weights = None
+        if self.aggregate_duplicates:
+            with self.recorder.stage("aggregate", rows=len(train_df)):
+                train_df = self._aggregate_training(train_df, parameters, folder)
+            train_rows = None  # Aggregated rows no longer stand for a single data row
+
+        if self.max_train_rows is not None and len(train_df) > self.max_train_rows:
+            with self.recorder.stage("subsample", rows=len(train_df)):
+                train_df = self._subsample_training(train_df, parameters, folder, train_rows)
+            if self.train_weights is not None:
+                self.train_weights = self.train_weights[self.train_subsample_idx]
+
         target_values = train_df[self.target]
 
-        # Create MED parameters
-        med_params = medeq.create_parameters(
-            parameters["names"],
-            minimums=parameters["minimums"],
-            maximums=parameters["maximums"]
-        )
+        with self.recorder.stage("med_augment", rows=len(train_df)):
+            # Create MED parameters
+            med_params = medeq.create_parameters(
+                parameters["names"],
+                minimums=parameters["minimums"],
+                maximums=parameters["maximums"]
+            )
 
-        # Create MED object
-        med = medeq.MED(med_params, response_names=target_values.name, seed=200)
+            # Create MED object
+            med = medeq.MED(med_params, response_names=target_values.name, seed=MED_SEED)
 
-        # Add data
-        med.augment(train_df[parameters["names"]], target_values)
+            # Add data
+            med.augment(train_df[parameters["names"]], target_values)
 
         # Save results
-        med.save(self.folder_save_name)
+        with self.recorder.stage("med_save", rows=len(train_df)):
+            med.save(folder)
 
-        # Discover equations
-        med.discover(
-            binary_operators=["+", "-", "*", "/", "^"],
-            constraints={"^": (-1, 1)},  # (-1, 1) is the encoded constraint for "^" operator
-            unary_operators=["exp", "log"]
-        )
+        # Discover equations. PySR writes the hall of fame into a fresh temp directory, which
+        # lands inside this run's working directory rather than the shared system temp tree
+        with self.recorder.stage("discover", rows=len(train_df)), isolated_tempdir(work_dir) as work_dir:
+            settings = {**self.discovery_settings, **(search_settings or {})}
+            if self.n_threads is not None:
+                settings.setdefault("procs", self.n_threads)
+            med.discover(**settings)
+
+        with self.recorder.stage("capture_hof"):
+            hof_path = find_hof_file(os.path.join(work_dir, "**", "hall_of_fame.csv"))
+            moved = move_hof_file(folder, hof_path)
+
+        if moved:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+            if run_info is not None:
+                with open(os.path.join(folder, RUN_INFO_FILE), "w") as f:
+                    json.dump(run_info, f, indent=4, default=str)
+
+        return moved
 
 
-    def test_equations(self, test_df: pd.DataFrame, tmp_path=None) -> pd.DataFrame:
+    def test_equations(self, test_df: pd.DataFrame, tmp_path=None, backend: str | None = None) -> pd.DataFrame:
         """
         Tests MED results by evaluating equations on test data and computing relative errors.
 
         Args:
             test_df (pd.DataFrame): Testing dataset.
             tmp_path (str, optional): Path to MED result CSV file.
+            backend (str, optional): Equation evaluation backend, overriding the one set on the processor.
 
         Returns:
             pd.DataFrame: A DataFrame containing actual values and relative errors for each complexity.
         """
         eq_path = tmp_path if tmp_path else f"{self.folder_save_name}/hall_of_fame.csv"
-        df_equations = pd.read_csv(eq_path)
 
-        # Create symbolic functions for each equation using n parameters
-        df_equations["Function"] = df_equations.apply(
-            lambda row: create_function(row["Equation"], *self.param_names), axis=1
-        )
+        with self.recorder.stage("compile_equations"):
+            df_equations = pd.read_csv(eq_path)
+
+            # Compile every equation into one function, so subexpressions shared between complexities
+            # are only evaluated once
+            fused_func = create_fused_function(
+                list(df_equations["Equation"]), *self.param_names, backend=backend or self.backend
+            )
+
+        with self.recorder.stage("evaluate", rows=len(test_df)):
+            # Sort test data by all parameters (for consistency)
+            test_df = test_df.sort_values(by=self.param_names)
 
-        # Sort test data by all parameters (for consistency)
-        test_df = test_df.sort_values(by=self.param_names)
+            return self._evaluate_equations(test_df, df_equations["Complexity"], fused_func)
 
-        results = []
-        for _, test_row in test_df.iterrows():
-            result_row = {param: test_row[param] for param in self.param_names}
-            result_row[self.target] = test_row[self.target]
 
-            for _, eq_row in df_equations.iterrows():
-                func = eq_row["Function"]
-                complexity = eq_row["Complexity"]
+    def _evaluate_equations(self, test_df: pd.DataFrame, complexities, fused_func: callable) -> pd.DataFrame:
+        # Evaluate the equations once on whole columns rather than row by row
+        param_values = [test_df[param].to_numpy(dtype=float) for param in self.param_names]
+        actual = test_df[self.target].to_numpy(dtype=float)
 
-                if func:
-                    # Ensure correct parameter order
-                    param_values = [test_row[param] for param in self.param_names]
-                    pred = func(*param_values)
-                    actual = test_row[self.target]
+        preds = np.empty((len(complexities), len(actual)))
+        for i, pred in enumerate(fused_func(*param_values)):
+            # Constant equations return a scalar, so broadcast to one prediction per row
+            preds[i] = np.broadcast_to(pred, actual.shape)
 
-                    err = np.abs(actual - pred) / (np.abs(actual) + 1e-8)
-                    result_row[f"Complexity {complexity} {self.target} p err"] = err
+        errors = np.abs(actual - preds) / (np.abs(actual) + 1e-8)
 
-            results.append(result_row)
+        results = {param: values for param, values in zip(self.param_names, param_values)}
+        results[self.target] = actual
+        for complexity, err in zip(complexities, errors):
+            results[f"Complexity {complexity} {self.target} p err"] = err
 
         return pd.DataFrame(results)
 
 
+    def run_cross_validation(
+            self,
+            n_folds: int,
+            seed=42,
+            n_repeats=1,
+            key: str | None = None,
+            run_info: dict | None = None
+        ) -> pd.DataFrame:
+        """
+        Runs (repeated) K-fold cross-validation: MED discovery on each fold's training rows, then
+        evaluation of that fold's equations on its held-out rows.
+
+        Each fold's MED output is saved to a fold_r<repeat>_k<fold> folder inside the results folder,
+        and the results of every fold are consolidated into cv_hall_of_fame.csv, med_cv_unseen.csv and
+        med_cv_summary.csv (median relative error per complexity and fold) in the results folder.
+
+        Args:
+            n_folds (int): Number of folds per repeat.
+            seed (int): Random seed for reproducibility.
+            n_repeats (int): Number of times the K-fold split is repeated with a new shuffle (Default: 1).
+            key (str, optional): Run key of the cross-validation. Folds with a completed discovery for it are reused.
+            run_info (dict, optional): Written to each fold's run_info.json, together with the fold's key.
+
+        Returns:
+            pd.DataFrame: The consolidated test results of every fold, with "Repeat" and "Fold" columns.
+        """
+        folds, parameters = self.prepare_folds(n_folds, seed, n_repeats)
+
+        hofs, results = [], []
+        for fold in folds:
+            label = f"fold_r{fold['repeat']}_k{fold['fold']}"
+            fold_folder = os.path.join(self.folder_save_name, label)
+            fold_key = hash_fields(run=key, repeat=fold["repeat"], fold=fold["fold"]) if key is not None else None
+
+            with self.recorder.tagged(fold=label):
+                cached = fold_key is not None and self.has_cached_discovery(fold_key, fold_folder)
+                train_df, test_df = self.fold_frames(fold, train=not cached)
+
+                if cached:
+                    print(f"Reusing cached discovery results in '{fold_folder}'")
+                else:
+                    fold_info = {**(run_info or {}), "run_key": fold_key, "repeat": fold["repeat"], "fold": fold["fold"]}
+                    discovered = self.run_med_discovery(
+                        train_df, parameters, run_info=fold_info, folder=fold_folder, train_rows=fold["train_idx"]
+                    )
+                    if not discovered:
+                        raise RuntimeError(f"MED discovery did not produce a hall_of_fame.csv for '{fold_folder}'")
+                del train_df
+
+                hof_path = os.path.join(fold_folder, "hall_of_fame.csv")
+                fold_results = self.test_equations(test_df, hof_path)
+                del test_df
+            fold_results.insert(0, "Fold", fold["fold"])
+            fold_results.insert(0, "Repeat", fold["repeat"])
+            results.append(fold_results)
+
+            df_hof = pd.read_csv(hof_path)
+            df_hof.insert(0, "Fold", fold["fold"])
+            df_hof.insert(0, "Repeat", fold["repeat"])
+            hofs.append(df_hof)
+
+        df_results = pd.concat(results, ignore_index=True)
+        with self.recorder.stage("write_results", rows=len(df_results)):
+            df_results.to_csv(os.path.join(self.folder_save_name, "med_cv_unseen.csv"))
+            pd.concat(hofs, ignore_index=True).to_csv(os.path.join(self.folder_save_name, "cv_hall_of_fame.csv"), index=False)
+
+            error_columns = [column for column in df_results.columns if column.endswith(" p err")]
+            df_summary = df_results.groupby(["Repeat", "Fold"])[error_columns].median()
+            df_summary.to_csv(os.path.join(self.folder_save_name, "med_cv_summary.csv"))
+
+        return df_results
+
+
     def get_complexity_equation(self, complexity: int, tmp_path=None) -> str | None:
         """
         Fetches the equation from the hall_of_fame.csv file based on the given complexity.
@@ -145,4 +728,29 @@ class MEDProcessor:
 
         equation_row = df_equations[df_equations["Complexity"] == complexity]
 
-        return equation_row["Equation"].values[0] if not equation_row.empty else None
\ No newline at end of file
+        return equation_row["Equation"].values[0] if not equation_row.empty else None
+
+
+def warm_up_medeq() -> float:
+    """
+    Runs a tiny MED discovery on synthetic data, so the medeq/PySR/Julia start-up and JIT
+    compilation are paid once per process rather than by the first real regression.
+
+    Returns:
+        float: The time taken in seconds.
+    """
+    start = time.perf_counter()
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"x1": rng.uniform(1, 2, 20), "x2": rng.uniform(1, 2, 20)})
+    df["y"] = df["x1"] * df["x2"]
+
+    with tempfile.TemporaryDirectory(prefix="med_warm_up_") as folder:
+        processor = MEDProcessor(
+            ["x1", "x2"], df, "y", folder,
+            discovery_settings={**DISCOVERY_SETTINGS, **WARM_UP_SETTINGS}
+        )
+        train_df, _, parameters = processor.prepare_data(1.0, 0)
+        processor.run_med_discovery(train_df, parameters)
+
+    return time.perf_counter() - start
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+
+# Shared frames attached by this process, kept open for the life of the process so that
+# long-lived workers attach to each dataset once, and DataFrame views never outlive their buffer
+_attached: dict[str, "SharedFrame"] = {}
+
+
+class SharedFrame:
+    def __init__(
+            self,
+            shm: shared_memory.SharedMemory,
+            columns: list[str],
+            n_rows: int,
+            owner: bool,
+            dtype: str = "float64"
+        ):
+        """
+        Initialises the SharedFrame, a float table held in shared memory with one contiguous block per column.
+
+        Use SharedFrame.from_dataframe to create one and SharedFrame.attach to open it in another process.
+
+        Args:
+            shm (shared_memory.SharedMemory): The shared memory block holding the table.
+            columns (list[str]): The column names, in storage order.
+            n_rows (int): The number of rows.
+            owner (bool): Whether this process created the block and is responsible for unlinking it.
+            dtype (str): The float dtype of the table, "float64" or "float32" (Default: "float64").
+        """
+        self.shm = shm
+        self.columns = columns
+        self.n_rows = n_rows
+        self.owner = owner
+        self.dtype = dtype
+        self.values = np.ndarray((len(columns), n_rows), dtype=dtype, buffer=shm.buf)
+
+        if not owner:
+            self.values.flags.writeable = False
+
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, dtype: str | None = None) -> "SharedFrame":
+        """
+        Copies the columns of a DataFrame into a new shared memory block.
+
+        Args:
+            df (pd.DataFrame): The data to share. All columns must be numeric.
+            dtype (str, optional): The float dtype to store the table as, "float64" or "float32" (Default:
+                float32 if every column already is, and float64 otherwise).
+
+        Returns:
+            SharedFrame: The owning SharedFrame. Call unlink() once every worker is done with it.
+        """
+        columns = [str(column) for column in df.columns]
+        if dtype is None:
+            dtype = "float32" if all(column_dtype == np.float32 for column_dtype in df.dtypes) else "float64"
+        size = max(len(columns) * len(df) * np.dtype(dtype).itemsize, 1)
+
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        shared = cls(shm, columns, len(df), owner=True, dtype=dtype)
+
+        for i, column in enumerate(df.columns):
+            shared.values[i] = df[column].to_numpy(dtype=dtype)
+
+        return shared
+
+
+    @property
+    def spec(self) -> dict:
+        """
+        A small picklable description of the frame that other processes pass to SharedFrame.attach.
+        """
+        return {"name": self.shm.name, "columns": self.columns, "n_rows": self.n_rows, "dtype": self.dtype}
+
+
+    @classmethod
+    def attach(cls, spec: dict) -> "SharedFrame":
+        """
+        Attaches to a shared frame created by another process, without copying its data.
+
+        Args:
+            spec (dict): The spec of the frame (see SharedFrame.spec).
+
+        Returns:
+            SharedFrame: A read-only view of the frame.
+        """
+        if spec["name"] in _attached:
+            return _attached[spec["name"]]
+
+        shm = shared_memory.SharedMemory(name=spec["name"])
+        shared = cls(shm, spec["columns"], spec["n_rows"], owner=False, dtype=spec["dtype"])
+        _attached[spec["name"]] = shared
+
+        return shared
+
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Returns a DataFrame view of the shared data. No data is copied, so the SharedFrame must be
+        kept referenced for as long as the view is used.
+
+        Returns:
+            pd.DataFrame: The DataFrame, backed by the shared memory block.
+        """
+        # The transposed (columns, rows) array is exactly the layout pandas keeps a float block in
+        return pd.DataFrame(self.values.T, columns=self.columns, copy=False)
+
+
+    def unlink(self):
+        """
+        Releases the shared memory block. Only the owning process should call this.
+        """
+        self.values = None
+        self.shm.close()
+        self.shm.unlink()
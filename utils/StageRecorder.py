@@ -0,0 +1,287 @@
+import os
+import glob
+import json
+import time
+import shutil
+import signal
+import cProfile
+import pstats
+import subprocess
+import tracemalloc
+import pandas as pd
+from contextlib import contextmanager
+from .proc_utils import peak_rss_bytes, RSSSampler
+
+
+# Stage events of a regression are written to this file in its results folder
+STAGE_FILE = "stage_timings.jsonl"
+
+# Comma-separated stages (or groups of stages) to profile, e.g. MED_PROFILE=discovery,evaluation or MED_PROFILE=all
+PROFILE_ENV = "MED_PROFILE"
+PROFILE_FOLDER = "profiles"
+PROFILE_GROUPS = {
+    "prep": ("load_data", "prepare_data"),
+    "aggregation": ("aggregate", "subsample"),
+    "discovery": ("med_augment", "med_save", "discover", "capture_hof"),
+    "evaluation": ("compile_equations", "evaluate", "write_results"),
+}
+
+
+def profiled_stages(spec: str | None) -> frozenset[str]:
+    """
+    Parses a profiling switch such as "discovery,evaluate" into the stage names it selects.
+
+    Args:
+        spec (str | None): Comma-separated stage names, names of PROFILE_GROUPS, or "all". Empty or None
+            selects nothing.
+
+    Returns:
+        frozenset[str]: The selected stage names.
+    """
+    stages = set()
+    for name in (spec or "").split(","):
+        name = name.strip()
+        if name in ("all", "1"):
+            stages.update(stage for group in PROFILE_GROUPS.values() for stage in group)
+        elif name:
+            stages.update(PROFILE_GROUPS.get(name, (name,)))
+
+    return frozenset(stages)
+
+
+def load_stage_events(root: str) -> pd.DataFrame:
+    """
+    Reads the stage events of every regression under root into one DataFrame.
+
+    Args:
+        root (str): The batch output folder, searched recursively for stage_timings.jsonl files.
+
+    Returns:
+        pd.DataFrame: One row per stage event.
+    """
+    events = []
+    for path in glob.glob(os.path.join(root, "**", STAGE_FILE), recursive=True):
+        with open(path) as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+
+    return pd.DataFrame(events)
+
+
+class StageRecorder:
+    def __init__(
+            self,
+            path: str | None = None,
+            profile: str | None = None,
+            track_memory: bool = False,
+            trace_heap: bool = False,
+            **fields
+        ):
+        """
+        Initialises the StageRecorder, which times the stages of a regression and writes one JSON
+        line per stage to path.
+
+        Every event holds the stage name, its start time, duration, the number of rows it handled
+        (where given), the process's lifetime peak RSS so far (process_peak_rss_mb, not specific to the
+        stage) and its pid, plus the fields given here. With
+        track_memory, events also hold the peak RSS of the process tree (including child processes
+        such as Julia) sampled while the stage ran, and with trace_heap, the stage's peak traced
+        Python heap.
+
+        Args:
+            path (str, optional): The JSONL file events are written to, replaced if it exists. Without
+                one, events are only kept in memory (Default: None).
+            profile (str, optional): Stages to profile (see profiled_stages). Each profiled stage writes a
+                cProfile .pstats file, its top functions as .txt and, when py-spy is installed, a sampled
+                flamegraph .svg to the profiles folder next to path (Default: the MED_PROFILE environment variable).
+            track_memory (bool): Sample the process-tree RSS from a background thread (see RSSSampler). Each
+                sample scans the host's process table, a few milliseconds every 0.5s (2s without psutil) on a
+                busy host. Call close() once done to stop it (Default: False).
+            trace_heap (bool): Trace Python heap allocations with tracemalloc. This slows allocation-heavy
+                stages such as writing results several times over, which also shows in their timings, so
+                only use it to find what holds memory. Call close() once done to stop it (Default: False).
+            **fields: Fields added to every event, e.g. run and run_key.
+        """
+        self.path = path
+        self.fields = fields
+        self.events = []
+        self.profile = profiled_stages(profile if profile is not None else os.environ.get(PROFILE_ENV))
+        self._profiling = False
+
+        self.sampler = RSSSampler() if track_memory else None
+        self.trace_heap = trace_heap
+        self._started_tracing = False
+        if trace_heap and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+
+    @contextmanager
+    def stage(self, name: str, rows: int | None = None, **fields):
+        """
+        Times the enclosed block as one stage.
+
+        Args:
+            name (str): The stage name.
+            rows (int, optional): The number of rows the stage handles. Can also be set on the
+                yielded event once known.
+            **fields: Further fields of this event.
+
+        Yields:
+            dict: The event, written once the block exits (also when it raises).
+        """
+        event = {**self.fields, **fields, "stage": name, "rows": rows}
+        started = time.time()
+        start = time.perf_counter()
+
+        profiling = name in self.profile and self.path is not None and not self._profiling
+        if profiling:
+            profiler, sampler, profile_path = self._start_profile(name, event)
+
+        if self.trace_heap:
+            tracemalloc.reset_peak()
+        if self.sampler is not None:
+            self.sampler.reset()
+
+        try:
+            yield event
+        except BaseException as e:
+            event["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            event["started"] = started
+            event["duration_s"] = time.perf_counter() - start
+            if profiling:
+                event["profile"] = self._stop_profile(profiler, sampler, profile_path)
+            if self.trace_heap:
+                event["heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            if self.sampler is not None:
+                tree_rss = self.sampler.read()
+                event["tree_rss_peak_mb"] = tree_rss / 2 ** 20 if tree_rss is not None else None
+            peak_rss = peak_rss_bytes()
+            event["process_peak_rss_mb"] = peak_rss / 2 ** 20 if peak_rss is not None else None
+            event["pid"] = os.getpid()
+            self._write(event)
+
+
+    def _start_profile(self, name: str, event: dict) -> tuple:
+        folder = os.path.join(os.path.dirname(self.path), PROFILE_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        profile_path = os.path.join(folder, f"{event['fold']}_{name}" if "fold" in event else name)
+
+        # py-spy samples this process and its children (such as Julia) from outside, so it sees native frames too
+        sampler = None
+        if shutil.which("py-spy") is not None:
+            sampler = subprocess.Popen(
+                ["py-spy", "record", "--pid", str(os.getpid()), "--subprocesses", "--output", f"{profile_path}.svg"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+
+        self._profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        return profiler, sampler, profile_path
+
+
+    def _stop_profile(self, profiler: cProfile.Profile, sampler, profile_path: str) -> str:
+        profiler.disable()
+        self._profiling = False
+
+        profiler.dump_stats(f"{profile_path}.pstats")
+        with open(f"{profile_path}.txt", "w") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+
+        if sampler is not None:
+            # py-spy writes its flamegraph when interrupted
+            sampler.send_signal(signal.SIGINT)
+            try:
+                sampler.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                sampler.kill()
+
+        return profile_path
+
+
+    @contextmanager
+    def tagged(self, **fields):
+        """
+        Adds fields to the events of every stage recorded inside the enclosed block, e.g. a fold label.
+        """
+        saved = self.fields
+        self.fields = {**saved, **fields}
+        try:
+            yield
+        finally:
+            self.fields = saved
+
+
+    def _write(self, event: dict):
+        self.events.append(event)
+        if self.path is None:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, "a") as f:
+            f.write(json.dumps(event, default=str) + "\n")
+
+
+    def memory_peaks(self) -> dict[str, dict]:
+        """
+        Takes the highest memory figures recorded per stage.
+
+        Returns:
+            dict[str, dict]: For each stage, the peak "heap_mb" and "tree_rss_mb" (None where not recorded).
+        """
+        peaks = {}
+        for event in self.events:
+            stage = peaks.setdefault(event["stage"], {"heap_mb": None, "tree_rss_mb": None})
+            for name, field in (("heap_mb", "heap_peak_mb"), ("tree_rss_mb", "tree_rss_peak_mb")):
+                if event.get(field) is not None:
+                    stage[name] = max(stage[name] or 0.0, event[field])
+
+        return peaks
+
+
+    def summary(self) -> dict[str, dict]:
+        """
+        Returns the seconds spent in each stage ("stages", see totals), the rows each handled ("rows", where
+        recorded) and their memory peaks ("memory", see memory_peaks).
+        """
+        rows = {}
+        for event in self.events:
+            if event["rows"] is not None:
+                rows[event["stage"]] = rows.get(event["stage"], 0) + event["rows"]
+
+        return {"stages": self.totals(), "rows": rows, "memory": self.memory_peaks()}
+
+
+    def close(self):
+        """
+        Stops memory tracking, if it was started by this recorder.
+        """
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+    def totals(self) -> dict[str, float]:
+        """
+        Sums the recorded durations per stage.
+
+        Returns:
+            dict[str, float]: Seconds spent in each stage, in order of first appearance.
+        """
+        totals = {}
+        for event in self.events:
+            totals[event["stage"]] = totals.get(event["stage"], 0.0) + event["duration_s"]
+
+        return totals
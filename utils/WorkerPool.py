@@ -0,0 +1,322 @@
+import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+from .proc_utils import terminate_tree, tree_cpu_seconds
+
+
+# Consecutive times a worker slot may die before it is ready (e.g. a crash while importing
+# or warming up) before the slot is given up on
+MAX_STARTUP_FAILURES = 3
+
+
+def _worker_main(conn, func: callable, initializer: callable, initargs: tuple):
+    if initializer is not None:
+        initializer(*initargs)
+
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        index, job = message
+        try:
+            conn.send(("result", index, func(job)))
+        except Exception as e:
+            conn.send(("error", index, f"{type(e).__name__}: {e}"))
+
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, process: multiprocessing.Process, conn, slot: int):
+        self.process = process
+        self.conn = conn
+        self.slot = slot
+        self.ready = False
+        self.index = None  # The job being run, None while idle
+        self.started = None
+        self.wall_started = None
+        self.cpu_started = 0.0
+
+
+class WorkerPool:
+    def __init__(
+            self,
+            func: callable,
+            n_workers: int,
+            initializer: callable = None,
+            initargs: tuple = (),
+            wall_timeout: float | None = None,
+            cpu_timeout: float | None = None,
+            poll_interval: float = 1.0,
+            context: str = "spawn",
+            slots: list[dict] | None = None,
+            memory_budget: float | None = None,
+            max_startup_failures: int = MAX_STARTUP_FAILURES
+        ):
+        """
+        Initialises the WorkerPool, a set of long-lived worker processes supervised by a watchdog.
+
+        Unlike a ProcessPoolExecutor, each job's worker is known, so a job that runs past its
+        budget can be stopped on its own: the worker and all of its child processes are terminated
+        and a fresh worker takes its place, while the other workers carry on.
+
+        Args:
+            func (callable): Called in a worker with each job. Must be picklable, as must the jobs and results.
+            n_workers (int): The number of worker processes.
+            initializer (callable, optional): Called with initargs in each worker before it takes jobs.
+            initargs (tuple): Arguments for initializer (Default: ()).
+            wall_timeout (float, optional): Wall-clock seconds a job may run for (Default: no limit).
+            cpu_timeout (float, optional): CPU seconds a job's worker process tree may use (Default: no limit).
+            poll_interval (float): Seconds between budget checks (Default: 1.0).
+            context (str): The multiprocessing start method (Default: "spawn").
+            slots (list[dict], optional): Per-worker resources, one dict per worker with "env" (environment
+                variables the worker is started with) and "cpus" (CPUs to pin it to, or None). A replacement
+                worker gets the same resources as the one it replaces.
+            memory_budget (float, optional): Bytes of memory the running jobs may use together, going by the
+                estimates passed to run. A job is only started once its estimate fits (Default: no limit).
+            max_startup_failures (int): Consecutive times a worker may die before it is ready (in initializer, or
+                while starting up) before its slot is given up on. Once every slot is given up on, the queued
+                jobs fail rather than waiting for a worker forever (Default: MAX_STARTUP_FAILURES).
+        """
+        self.func = func
+        self.n_workers = n_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.wall_timeout = wall_timeout
+        self.cpu_timeout = cpu_timeout
+        self.poll_interval = poll_interval
+        self.context = multiprocessing.get_context(context)
+        self.slots = slots
+        self.memory_budget = memory_budget
+        self.max_startup_failures = max_startup_failures
+        self.workers = []
+        self.startup_failures = {}  # slot -> consecutive deaths before ready
+
+
+    def _spawn(self, slot: int) -> _Worker:
+        resources = self.slots[slot] if self.slots is not None else {}
+        env = resources.get("env") or {}
+
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main, args=(child_conn, self.func, self.initializer, self.initargs), daemon=True
+        )
+
+        # Thread counts such as JULIA_NUM_THREADS are read once at start-up, so they have to be in the
+        # environment the worker is started with rather than set inside it
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update({name: str(value) for name, value in env.items()})
+        try:
+            process.start()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        child_conn.close()
+
+        if resources.get("cpus"):
+            # Threads started later by the worker (including Julia's) inherit its affinity
+            os.sched_setaffinity(process.pid, resources["cpus"])
+
+        return _Worker(process, parent_conn, slot)
+
+
+    def _replace(self, worker: _Worker, grace: float = 5.0):
+        if worker.process.is_alive():
+            terminate_tree(worker.process.pid, grace)
+        worker.process.join()
+        worker.conn.close()
+
+        self.workers[self.workers.index(worker)] = self._spawn(worker.slot)
+
+
+    def _retire(self, worker: _Worker, grace: float = 5.0):
+        # Stops a worker without replacing it, once no queued job is left for a replacement to take
+        if worker.process.is_alive():
+            terminate_tree(worker.process.pid, grace)
+        worker.process.join()
+        worker.conn.close()
+
+        self.workers.remove(worker)
+
+
+    def _budget_exceeded(self, worker: _Worker, now: float) -> str | None:
+        if self.wall_timeout is not None and now - worker.wall_started > self.wall_timeout:
+            return f"wall-clock budget of {self.wall_timeout:g}s exceeded"
+
+        if self.cpu_timeout is not None:
+            cpu = tree_cpu_seconds(worker.process.pid)
+            if cpu is not None and cpu - worker.cpu_started > self.cpu_timeout:
+                return f"CPU budget of {self.cpu_timeout:g}s exceeded ({cpu - worker.cpu_started:.0f}s used)"
+
+        return None
+
+
+    def _next_job(self, queued: list[int], job_memory: list[float] | None) -> int | None:
+        if self.memory_budget is None or job_memory is None:
+            return queued.pop(0)
+
+        # Start the first queued job whose estimate fits next to the running ones. A job too big for
+        # the whole budget is still started once nothing else is running, so the batch cannot stall
+        in_use = sum(job_memory[worker.index] for worker in self.workers if worker.index is not None)
+        for position, index in enumerate(queued):
+            if in_use + job_memory[index] <= self.memory_budget:
+                return queued.pop(position)
+
+        if in_use == 0:
+            print(f"Job {queued[0]} is estimated to need more than the whole memory budget, running it alone")
+            return queued.pop(0)
+
+        return None
+
+
+    def run(
+            self,
+            jobs: list,
+            on_start: callable = None,
+            on_finish: callable = None,
+            job_memory: list[float] | None = None
+        ):
+        """
+        Runs every job, at most n_workers at a time, in order of submission (except that with a
+        memory budget, a later job that fits may start before an earlier one that does not).
+
+        Args:
+            jobs (list): The jobs, each passed to func.
+            on_start (callable, optional): Called with (index, pid) when a job is handed to a worker. A job
+                failed because no worker could start is passed to on_start with pid None before on_finish.
+            on_finish (callable, optional): Called with (index, result) when a job ends. result is what
+                func returned, or, when the job did not return, a dict with "started", "finished",
+                "duration_s" and "error" keys plus "timeout" (the reason) if it was stopped by the watchdog.
+            job_memory (list[float], optional): Estimated bytes of memory each job needs, used with memory_budget.
+        """
+        queued = list(range(len(jobs)))
+        self.workers = [self._spawn(slot) for slot in range(min(self.n_workers, len(jobs)))]
+        self.startup_failures = {}
+
+        def finish(worker, result):
+            index = worker.index
+            worker.index = None
+            if on_finish is not None:
+                on_finish(index, result)
+
+        def failure(worker, error, **fields):
+            now = time.time()
+            return {
+                "started": worker.started, "finished": now, "duration_s": now - worker.started,
+                "error": error, **fields
+            }
+
+        try:
+            while queued or any(worker.index is not None for worker in self.workers):
+                for worker in self.workers:
+                    if worker.ready and worker.index is None and queued:
+                        index = self._next_job(queued, job_memory)
+                        if index is None:
+                            break
+                        worker.index = index
+                        worker.started = time.time()
+                        worker.wall_started = time.monotonic()
+                        worker.cpu_started = tree_cpu_seconds(worker.process.pid) if self.cpu_timeout else 0.0
+                        worker.conn.send((worker.index, jobs[worker.index]))
+                        if on_start is not None:
+                            on_start(worker.index, worker.process.pid)
+
+                timeout = self.poll_interval if self.wall_timeout or self.cpu_timeout else None
+                wait(
+                    [worker.conn for worker in self.workers] + [worker.process.sentinel for worker in self.workers],
+                    timeout
+                )
+
+                for worker in list(self.workers):
+                    try:
+                        message = worker.conn.recv() if worker.conn.poll() else None
+                    except (EOFError, OSError):
+                        message = None
+
+                    if message is not None:
+                        if message[0] == "ready":
+                            worker.ready = True
+                            self.startup_failures[worker.slot] = 0
+                        elif message[0] == "result":
+                            finish(worker, message[2])
+                        else:
+                            finish(worker, failure(worker, message[2]))
+                        continue
+
+                    if not worker.process.is_alive():
+                        # The worker process itself died (e.g. killed by the OOM killer)
+                        if worker.index is not None:
+                            finish(worker, failure(worker, f"WorkerDied: exit code {worker.process.exitcode}"))
+
+                        given_up = False
+                        if not worker.ready:
+                            failures = self.startup_failures.get(worker.slot, 0) + 1
+                            self.startup_failures[worker.slot] = failures
+                            given_up = failures >= self.max_startup_failures
+                            if given_up:
+                                print(
+                                    f"Worker slot {worker.slot} died {failures} times before it was ready "
+                                    f"(last exit code {worker.process.exitcode}), not restarting it"
+                                )
+
+                        if queued and not given_up:
+                            self._replace(worker)
+                        else:
+                            self._retire(worker)
+                        continue
+
+                    if worker.index is not None:
+                        reason = self._budget_exceeded(worker, time.monotonic())
+                        if reason is not None:
+                            print(f"Stopping worker {worker.process.pid}: {reason}")
+                            if queued:
+                                self._replace(worker)
+                            else:
+                                self._retire(worker)
+                            finish(worker, failure(worker, f"Timeout: {reason}", timeout=reason))
+
+                if queued and not self.workers:
+                    error = (
+                        f"WorkerStartupFailed: no worker could start after {self.max_startup_failures} "
+                        f"attempts per slot"
+                    )
+                    print(f"{error}, failing the {len(queued)} queued jobs")
+                    while queued:
+                        index = queued.pop(0)
+                        now = time.time()
+                        if on_start is not None:
+                            on_start(index, None)
+                        if on_finish is not None:
+                            on_finish(index, {"started": now, "finished": now, "duration_s": 0.0, "error": error})
+        finally:
+            self.close()
+
+
+    def close(self):
+        """
+        Stops every worker. Idle workers exit cleanly, busy ones are terminated with their children.
+        """
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+
+        for worker in self.workers:
+            worker.process.join(timeout=5.0)
+            if worker.process.is_alive():
+                terminate_tree(worker.process.pid, grace=1.0)
+                worker.process.join()
+            worker.conn.close()
+
+        self.workers = []
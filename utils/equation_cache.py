@@ -0,0 +1,163 @@
+import os
+import re
+import inspect
+import hashlib
+import json
+from collections import OrderedDict
+import sympy as sp
+
+
+# Maximum number of compiled functions kept in memory per process
+MAX_CACHED_FUNCTIONS = 1024
+
+# Directory of the on-disk store of generated source. Disabled unless set here or through the environment
+CACHE_DIR_ENV = "MED_EQUATION_CACHE"
+_cache_dir = os.environ.get(CACHE_DIR_ENV) or None
+
+# Statements run to build the namespace that generated source is executed in, per backend.
+# These mirror the imports sympy.lambdify uses for the same module
+BACKEND_IMPORTS = {
+    "numpy": "import numpy; from numpy import *",
+}
+
+_memory_cache: OrderedDict[str, callable] = OrderedDict()
+
+
+def set_equation_cache_dir(path: str | None):
+    """
+    Sets the directory of the on-disk store of compiled equation source, or disables it with None.
+
+    Args:
+        path (str | None): The cache directory. Created on first write.
+    """
+    global _cache_dir
+    _cache_dir = path
+
+
+def clear_equation_cache():
+    """
+    Empties the in-process cache. The on-disk store is left untouched.
+    """
+    _memory_cache.clear()
+
+
+def normalize_equation(equation_str: str) -> str:
+    """
+    Normalises an equation string so formatting differences map to the same cache entry.
+    """
+    return "".join(equation_str.split())
+
+
+def equation_key(kind: str, equation_strs: list[str], param_names: tuple[str], backend: str) -> str:
+    """
+    Computes the cache key of a compiled function.
+
+    Args:
+        kind (str): What was compiled, e.g. "single" or "fused".
+        equation_strs (list[str]): The equation strings.
+        param_names (tuple[str]): The parameter names, in argument order.
+        backend (str): The evaluation backend.
+
+    Returns:
+        str: A hex digest.
+    """
+    fields = {
+        "kind": kind,
+        "equations": [normalize_equation(eq) for eq in equation_strs],
+        "params": list(param_names),
+        "backend": backend,
+        "sympy": sp.__version__  # Generated source changes between sympy releases
+    }
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _load_source(source: str, backend: str) -> callable:
+    namespace = {}
+    exec(BACKEND_IMPORTS[backend], namespace)
+    exec(source, namespace)
+
+    func_name = re.search(r"^def (\w+)\(", source, re.MULTILINE).group(1)
+
+    return namespace[func_name]
+
+
+def _read_disk(key: str, backend: str):
+    if _cache_dir is None or backend not in BACKEND_IMPORTS:
+        return None
+
+    path = os.path.join(_cache_dir, f"{key}.py")
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path) as f:
+            return _load_source(f.read(), backend)
+    except Exception as e:
+        print(f"Ignoring unreadable cached equation '{path}': {e}")
+        return None
+
+
+def _write_disk(key: str, backend: str, func: callable):
+    if _cache_dir is None or backend not in BACKEND_IMPORTS:
+        return
+
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        return
+
+    os.makedirs(_cache_dir, exist_ok=True)
+    path = os.path.join(_cache_dir, f"{key}.py")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "w") as f:
+        f.write(source)
+    os.replace(tmp_path, path)
+
+
+def cached_compile(
+        kind: str,
+        equation_strs: list[str],
+        param_names: tuple[str],
+        backend: str,
+        compile_fn: callable,
+        persist: bool = True
+    ) -> callable:
+    """
+    Returns a compiled equation function from the cache, compiling and storing it on a miss.
+
+    Lookups try the in-process LRU cache first, then the on-disk store of generated source (if
+    enabled), and only then call compile_fn.
+
+    Args:
+        kind (str): What is being compiled, e.g. "single" or "fused".
+        equation_strs (list[str]): The equation strings.
+        param_names (tuple[str]): The parameter names, in argument order.
+        backend (str): The evaluation backend.
+        compile_fn (callable): Called with no arguments to compile the function on a miss.
+        persist (bool): Whether the on-disk store applies. Only functions generated from source
+            (such as sympy.lambdify output) can be persisted (Default: True).
+
+    Returns:
+        callable: The compiled function.
+    """
+    key = equation_key(kind, equation_strs, param_names, backend)
+
+    func = _memory_cache.get(key)
+    if func is not None:
+        _memory_cache.move_to_end(key)
+        return func
+
+    func = _read_disk(key, backend) if persist else None
+    if func is None:
+        func = compile_fn()
+        if persist:
+            _write_disk(key, backend, func)
+
+    _memory_cache[key] = func
+    if len(_memory_cache) > MAX_CACHED_FUNCTIONS:
+        _memory_cache.popitem(last=False)
+
+    return func
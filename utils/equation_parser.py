@@ -0,0 +1,361 @@
+import re
+import math
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Evaluation backends accepted by compile_equations
+BACKENDS = ("numpy", "numexpr", "numba")
+
+
+class UnsupportedEquation(ValueError):
+    """Raised when an equation uses syntax outside the grammar handled by this parser."""
+
+
+# The grammar of the equations PySR writes with this workflow's operators:
+# numbers, parameter names, + - * / ^, unary minus, parentheses and exp/log calls
+_TOKEN_RE = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)|([A-Za-z_]\w*)|(.))")
+
+_BINARY_PRECEDENCE = {"+": 10, "-": 10, "*": 20, "/": 20, "^": 40}
+_UNARY_MINUS_PRECEDENCE = 30
+
+_BINARY_OPS = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+    "^": np.power,
+}
+
+_FUNCTIONS = {
+    "exp": np.exp,
+    "log": np.log,
+}
+
+
+def _tokenize(equation_str: str) -> list[tuple[str, str]]:
+    tokens = []
+    for number, name, symbol in _TOKEN_RE.findall(equation_str):
+        if number:
+            tokens.append(("num", number))
+        elif name:
+            tokens.append(("name", name))
+        elif symbol.strip():
+            tokens.append(("op", symbol))
+
+    return tokens
+
+
+class _Program:
+    """
+    A flat list of instructions shared by every equation compiled together.
+
+    Each node of every expression tree is interned, so a subexpression appearing in several
+    equations (or several times in one) becomes a single instruction evaluated once per call.
+    """
+    def __init__(self, param_names: tuple[str]):
+        self.param_names = param_names
+        self.instructions = []  # (op, *operands), node operands index earlier instructions
+        self.constants = {}  # instruction index -> value of constant (or constant-folded) nodes
+        self._interned = {}
+
+    def node(self, op: str, *operands) -> int:
+        key = (op, *operands)
+        index = self._interned.get(key)
+        if index is not None:
+            return index
+
+        index = len(self.instructions)
+        self.instructions.append(key)
+        self._interned[key] = index
+
+        if op == "const":
+            self.constants[index] = operands[0]
+        elif op != "var":
+            # Fold operations on constants at compile time
+            args = _node_operands(op, operands)
+            if all(arg in self.constants for arg in args):
+                with np.errstate(all="ignore"):
+                    self.constants[index] = float(_apply(op, operands, [self.constants[arg] for arg in args]))
+
+        return index
+
+
+def _node_operands(op: str, operands: tuple) -> tuple[int]:
+    if op in ("const", "var"):
+        return ()
+    if op == "call":
+        return operands[1:]
+
+    return operands
+
+
+def _apply(op: str, operands: tuple, args: list):
+    if op == "neg":
+        return np.negative(args[0])
+    if op == "call":
+        return _FUNCTIONS[operands[0]](args[0])
+
+    return _BINARY_OPS[op](args[0], args[1])
+
+
+class _Parser:
+    def __init__(self, equation_str: str, program: _Program):
+        self.equation_str = equation_str
+        self.tokens = _tokenize(equation_str)
+        self.pos = 0
+        self.program = program
+
+    def parse(self) -> int:
+        index = self._expression(0)
+        if self.pos != len(self.tokens):
+            raise UnsupportedEquation(f"Unexpected '{self.tokens[self.pos][1]}' in '{self.equation_str}'")
+
+        return index
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+
+        return token
+
+    def _expect(self, value: str):
+        kind, token = self._next()
+        if token != value:
+            raise UnsupportedEquation(f"Expected '{value}' in '{self.equation_str}'")
+
+    def _expression(self, min_precedence: int) -> int:
+        left = self._unary()
+
+        while True:
+            kind, token = self._peek()
+            precedence = _BINARY_PRECEDENCE.get(token) if kind == "op" else None
+            if precedence is None or precedence < min_precedence:
+                return left
+
+            self.pos += 1
+            # "^" is right associative, the others are left associative
+            right = self._expression(precedence if token == "^" else precedence + 1)
+            left = self.program.node(token, left, right)
+
+    def _unary(self) -> int:
+        kind, token = self._peek()
+
+        if kind == "op" and token in "+-":
+            self.pos += 1
+            # As in Python and sympy, unary minus binds less tightly than "^": -x^2 is -(x^2)
+            operand = self._expression(_UNARY_MINUS_PRECEDENCE)
+            return operand if token == "+" else self.program.node("neg", operand)
+
+        return self._atom()
+
+    def _atom(self) -> int:
+        kind, token = self._next()
+
+        if kind == "num":
+            return self.program.node("const", float(token))
+
+        if kind == "name":
+            if self._peek()[1] == "(":
+                if token not in _FUNCTIONS:
+                    raise UnsupportedEquation(f"Unsupported function '{token}' in '{self.equation_str}'")
+                self.pos += 1
+                operand = self._expression(0)
+                self._expect(")")
+                return self.program.node("call", token, operand)
+
+            if token not in self.program.param_names:
+                raise UnsupportedEquation(f"Unknown name '{token}' in '{self.equation_str}'")
+            return self.program.node("var", self.program.param_names.index(token))
+
+        if token == "(":
+            index = self._expression(0)
+            self._expect(")")
+            return index
+
+        raise UnsupportedEquation(f"Unexpected '{token}' in '{self.equation_str}'")
+
+
+def _usage_counts(program: _Program, outputs: list[int]) -> list[int]:
+    counts = [0] * len(program.instructions)
+    for index in outputs:
+        counts[index] += 1
+    for op, *operands in program.instructions:
+        for arg in _node_operands(op, operands):
+            counts[arg] += 1
+
+    return counts
+
+
+def _format_constant(value: float, nan: str, inf: str) -> str:
+    if math.isnan(value):
+        return nan
+    if math.isinf(value):
+        return inf if value > 0 else f"(-{inf})"
+
+    return f"({value!r})"
+
+
+def _format_node(op: str, operands: tuple, args: list[str]) -> str:
+    if op == "neg":
+        return f"(-{args[0]})"
+    if op == "call":
+        return f"{operands[0]}({args[0]})"
+    if op == "^":
+        return f"({args[0]} ** {args[1]})"
+
+    return f"({args[0]} {op} {args[1]})"
+
+
+def _numpy_function(program: _Program, outputs: list[int]) -> callable:
+    # Everything but the parameters and folded constants is computed on each call
+    steps = [
+        (index, op, operands, _node_operands(op, operands))
+        for index, (op, *operands) in enumerate(program.instructions)
+        if op != "var" and index not in program.constants
+    ]
+    variables = [(index, operands[0]) for index, (op, *operands) in enumerate(program.instructions) if op == "var"]
+    constants = program.constants
+    size = len(program.instructions)
+
+    def evaluate(*param_values):
+        values = [None] * size
+        for index, value in constants.items():
+            values[index] = value
+        for index, param_index in variables:
+            values[index] = param_values[param_index]
+
+        for index, op, operands, args in steps:
+            values[index] = _apply(op, operands, [values[arg] for arg in args])
+
+        return [values[index] for index in outputs]
+
+    return evaluate
+
+
+def _numexpr_function(program: _Program, outputs: list[int]) -> callable:
+    if numexpr is None:
+        raise ImportError("The 'numexpr' backend requires the numexpr package")
+
+    # Subexpressions used more than once are evaluated into a temporary array of their own,
+    # everything else is inlined into the expression strings numexpr compiles. Folded constants
+    # are passed by name: numexpr folds literals itself in Python, so "x1 / 0" would raise
+    # ZeroDivisionError instead of giving inf like the other backends
+    counts = _usage_counts(program, outputs)
+    exprs = {}
+    temporaries = []
+    constant_values = {}
+
+    for index, (op, *operands) in enumerate(program.instructions):
+        if index in program.constants:
+            exprs[index] = f"c{index}"
+            constant_values[f"c{index}"] = np.float64(program.constants[index])
+        elif op == "var":
+            exprs[index] = f"p{operands[0]}"
+        else:
+            exprs[index] = _format_node(op, operands, [exprs[arg] for arg in _node_operands(op, operands)])
+            if counts[index] > 1:
+                temporaries.append((f"t{index}", exprs[index]))
+                exprs[index] = f"t{index}"
+
+    output_exprs = [exprs[index] for index in outputs]
+    output_constants = [program.constants.get(index) for index in outputs]
+
+    def evaluate(*param_values):
+        local_dict = {f"p{i}": np.asarray(values, dtype=float) for i, values in enumerate(param_values)}
+        local_dict.update(constant_values)
+        for name, expr in temporaries:
+            local_dict[name] = numexpr.evaluate(expr, local_dict=local_dict)
+
+        return [
+            constant if constant is not None else numexpr.evaluate(expr, local_dict=local_dict)
+            for expr, constant in zip(output_exprs, output_constants)
+        ]
+
+    return evaluate
+
+
+def _numba_function(program: _Program, outputs: list[int], n_params: int) -> callable:
+    if numba is None:
+        raise ImportError("The 'numba' backend requires the numba package")
+
+    # Generate a row-parallel kernel computing every equation in one pass over the data
+    lines = [f"def kernel({', '.join(f'p{i}' for i in range(n_params))}, out):"]
+    lines.append("    for row in numba.prange(out.shape[1]):")
+
+    for index, (op, *operands) in enumerate(program.instructions):
+        if index in program.constants:
+            expr = _format_constant(program.constants[index], "np.nan", "np.inf")
+        elif op == "var":
+            expr = f"p{operands[0]}[row]"
+        elif op == "call":
+            expr = f"np.{operands[0]}(v{operands[1]})"
+        else:
+            expr = _format_node(op, operands, [f"v{arg}" for arg in _node_operands(op, operands)])
+        lines.append(f"        v{index} = {expr}")
+
+    for i, index in enumerate(outputs):
+        lines.append(f"        out[{i}, row] = v{index}")
+
+    namespace = {"np": np, "numba": numba}
+    exec("\n".join(lines), namespace)
+    kernel = numba.njit(parallel=True, error_model="numpy")(namespace["kernel"])
+
+    def evaluate(*param_values):
+        columns = [np.ascontiguousarray(values, dtype=float) for values in param_values]
+        out = np.empty((len(outputs), len(columns[0]) if columns else 1))
+        kernel(*columns, out)
+
+        return list(out)
+
+    return evaluate
+
+
+def compile_equations(equation_strs: list[str], param_names: tuple[str], backend: str = "numpy") -> callable:
+    """
+    Compiles PySR equation strings into one function without going through sympy.
+
+    Handles the grammar PySR writes with this workflow's operators: numbers, parameter names,
+    + - * / ^, unary minus, parentheses and exp/log. Subexpressions shared between equations
+    are evaluated once per call.
+
+    Args:
+        equation_strs (list[str]): The equation strings.
+        param_names (tuple[str]): Parameter names, in argument order.
+        backend (str): How the equations are evaluated (Default: "numpy"):
+            - "numpy": one NumPy operation per node.
+            - "numexpr": multithreaded, chunked evaluation of each equation with numexpr.
+            - "numba": a Numba-JIT kernel computing every equation in one parallel pass over the rows.
+
+    Raises:
+        UnsupportedEquation: If an equation uses anything outside that grammar.
+        ImportError: If the package the backend needs is not installed.
+
+    Returns:
+        callable: A function of the parameter arrays returning a list with one result per
+            equation. With the numpy backend, constant equations return a float.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    program = _Program(tuple(param_names))
+    outputs = [_Parser(equation_str, program).parse() for equation_str in equation_strs]
+
+    if backend == "numexpr":
+        return _numexpr_function(program, outputs)
+    if backend == "numba":
+        return _numba_function(program, outputs, len(param_names))
+
+    return _numpy_function(program, outputs)
@@ -4,11 +4,36 @@ import numpy as np
 import glob
 import os
 import shutil
+import tempfile
+import hashlib
+import json
+from contextlib import contextmanager
+from functools import lru_cache
+from .equation_cache import cached_compile
+from .equation_parser import compile_equations, UnsupportedEquation
+
+
+def parse_equation(equation_str: str) -> sp.Expr:
+    """
+    Parses a PySR equation string into a sympy expression, translating "^" into "**".
+
+    Args:
+        equation_str (str): The equation string, e.g., "x + y^2".
+
+    Returns:
+        sp.Expr: The parsed expression.
+    """
+    equation_str = equation_str.replace("^", "**")
+
+    return sp.sympify(equation_str, locals={"exp": sp.exp, "log": sp.log})
 
 
 def create_function(equation_str: str, *param_names: str) -> callable:
     """
-    Converts a string representation of a function into a callable using sympy.lambdify.
+    Converts a string representation of a function into a callable.
+
+    Equations in the PySR grammar are compiled directly by equation_parser; anything it does not
+    recognise falls back to sympy.lambdify. Compiled functions are cached (see equation_cache).
 
     Args:
         equation_str (str): The equation string, e.g., "x + y".
@@ -17,26 +42,339 @@ def create_function(equation_str: str, *param_names: str) -> callable:
     Returns:
         callable: A NumPy-compatible function that evaluates the equation.
     """
-    equation_str = equation_str.replace("^", "**")
+    try:
+        fused = cached_compile(
+            "parsed", [equation_str], param_names, "numpy",
+            lambda: compile_equations([equation_str], param_names), persist=False
+        )
+        return lambda *param_values: fused(*param_values)[0]
+    except UnsupportedEquation:
+        pass
+
+    def compile_function():
+        symbols = sp.symbols(param_names)  # Create sympy symbols dynamically
+        expr = parse_equation(equation_str)
+
+        return sp.lambdify(symbols, expr, "numpy")
+
+    return cached_compile("single", [equation_str], param_names, "numpy", compile_function)
+
 
-    symbols = sp.symbols(param_names)  # Create sympy symbols dynamically
-    expr = sp.sympify(equation_str, locals={"exp": sp.exp, "log": sp.log})
+def create_fused_function(equation_strs: list[str], *param_names: str, backend: str = "numpy") -> callable:
+    """
+    Compiles several equations into a single callable that evaluates all of them in one pass.
+
+    Subexpressions shared between equations (PySR hall-of-fame equations usually nest the simpler
+    ones) are evaluated only once per call. Equations in the PySR grammar are compiled directly by
+    equation_parser; if any is not recognised, all are compiled with sympy.lambdify and
+    common-subexpression elimination instead. Compiled functions are cached (see equation_cache).
+
+    Args:
+        equation_strs (list[str]): The equation strings.
+        *param_names (str): Parameter names used in the equations.
+        backend (str): Evaluation backend, one of "numpy", "numexpr" or "numba" (see
+            equation_parser.compile_equations). Equations that need the sympy fallback always use NumPy.
+
+    Returns:
+        callable: A NumPy-compatible function returning a list with one result per equation.
+            Constant equations return a scalar.
+    """
+    equation_strs = list(equation_strs)
+
+    try:
+        return cached_compile(
+            "parsed", equation_strs, param_names, backend,
+            lambda: compile_equations(equation_strs, param_names, backend), persist=False
+        )
+    except UnsupportedEquation as e:
+        if backend != "numpy":
+            print(f"Falling back to sympy with the numpy backend: {e}")
 
-    func = sp.lambdify(symbols, expr, "numpy")
+    def compile_function():
+        symbols = sp.symbols(param_names)
+        exprs = [parse_equation(equation_str) for equation_str in equation_strs]
 
-    return func
+        return sp.lambdify(symbols, exprs, "numpy", cse=True)
+
+    return cached_compile("fused", equation_strs, param_names, "numpy", compile_function)
+
+
+@lru_cache(maxsize=64)
+def split_indices(n_rows: int, split_frac: float, seed=100, dataset_key: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Draws a seeded train/test split of row positions.
+
+    Results are cached per (dataset, seed, fraction), so every study in a process that uses the same
+    seed on the same dataset shares one split. The returned arrays are read-only.
+
+    Args:
+        n_rows (int): The number of rows to split.
+        split_frac (float): Fraction of rows to put in the train split.
+        seed (int): Random seed for the numpy Generator that shuffles the rows.
+        dataset_key (str, optional): Identifies the dataset (e.g. its content hash) in the cache key.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The train and test row positions.
+    """
+    permutation = np.random.default_rng(seed).permutation(n_rows)
+    split_idx = int(split_frac * n_rows)
+
+    train_idx, test_idx = permutation[:split_idx], permutation[split_idx:]
+    train_idx.flags.writeable = False
+    test_idx.flags.writeable = False
+
+    return train_idx, test_idx
+
+
+def hash_uniform(positions: np.ndarray, seed: int) -> np.ndarray:
+    """
+    Maps row positions to reproducible pseudo-random numbers in [0, 1) with the splitmix64 hash.
+
+    Unlike drawing from a generator, the value for a row depends only on its position and the seed,
+    so rows can be assigned to splits one chunk at a time.
+
+    Args:
+        positions (np.ndarray): Non-negative integer row positions.
+        seed (int): Random seed.
+
+    Returns:
+        np.ndarray: One float in [0, 1) per position.
+    """
+    z = np.asarray(positions, dtype=np.uint64) + np.uint64((seed * 0x9E3779B97F4A7C15) % 2**64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+
+    return (z >> np.uint64(11)).astype(np.float64) / 2.0**53
+
+
+def kfold_indices(n_rows: int, n_folds: int, seed=100, n_repeats=1) -> list[tuple[int, int, np.ndarray, np.ndarray]]:
+    """
+    Draws (repeated) K-fold cross-validation splits of row positions.
+
+    Each repeat draws one permutation of the rows from a numpy Generator and cuts it into n_folds
+    near-equal held-out sets. The training rows of a fold are all the others.
+
+    Args:
+        n_rows (int): The number of rows to split.
+        n_folds (int): Number of folds per repeat (at least 2).
+        seed (int): Random seed for the numpy Generator.
+        n_repeats (int): Number of repeats, each with its own permutation (Default: 1).
+
+    Returns:
+        list[tuple[int, int, np.ndarray, np.ndarray]]: (repeat, fold, train positions, test positions) per fold.
+    """
+    if n_folds < 2 or n_folds > n_rows:
+        raise ValueError(f"n_folds must be between 2 and the number of rows ({n_rows}), got {n_folds}")
+
+    rng = np.random.default_rng(seed)
+
+    folds = []
+    for repeat in range(n_repeats):
+        test_sets = np.array_split(rng.permutation(n_rows), n_folds)
+
+        for fold, test_idx in enumerate(test_sets):
+            train_idx = np.concatenate([other for i, other in enumerate(test_sets) if i != fold])
+            folds.append((repeat, fold, train_idx, test_idx))
+
+    return folds
+
+
+def subsample_indices(
+        values: np.ndarray,
+        n_samples: int,
+        minimums: list[float],
+        maximums: list[float],
+        method: str = "maximin",
+        seed=0
+    ) -> np.ndarray:
+    """
+    Selects a representative subset of points spread over the parameter space.
+
+    Points are scaled to the unit cube by the parameter bounds first, so every parameter counts equally.
+
+    Args:
+        values (np.ndarray): The points, one row per point and one column per parameter.
+        n_samples (int): The number of points to select.
+        minimums (list[float]): Lower bound of each parameter.
+        maximums (list[float]): Upper bound of each parameter.
+        method (str): How points are selected (Default: "maximin"):
+            - "maximin": greedy farthest-point sampling, each pick maximising its distance to those already picked.
+            - "grid": one random point from each occupied cell of a regular grid over the bounds.
+            - "random": a uniform random sample.
+        seed (int): Random seed.
+
+    Returns:
+        np.ndarray: The sorted row positions of the selected points.
+    """
+    n_points = len(values)
+    if n_samples >= n_points:
+        return np.arange(n_points)
+
+    rng = np.random.default_rng(seed)
+    span = np.asarray(maximums, dtype=float) - np.asarray(minimums, dtype=float)
+    unit = (values - np.asarray(minimums, dtype=float)) / np.where(span > 0, span, 1.0)
+
+    if method == "random":
+        selected = rng.choice(n_points, n_samples, replace=False)
+
+    elif method == "maximin":
+        selected = np.empty(n_samples, dtype=np.int64)
+        selected[0] = rng.integers(n_points)
+        distances = np.sum((unit - unit[selected[0]]) ** 2, axis=1)
+
+        for i in range(1, n_samples):
+            selected[i] = np.argmax(distances)
+            np.minimum(distances, np.sum((unit - unit[selected[i]]) ** 2, axis=1), out=distances)
+
+    elif method == "grid":
+        bins = max(int(np.ceil(n_samples ** (1 / unit.shape[1]))), 1)
+        cells = np.minimum((unit * bins).astype(np.int64), bins - 1)
+        cell_ids = np.ravel_multi_index(cells.T, (bins,) * unit.shape[1])
+
+        # A random point of each occupied cell: shuffle, then keep the first point seen per cell
+        order = rng.permutation(n_points)
+        _, first = np.unique(cell_ids[order], return_index=True)
+        selected = order[first]
+
+        if len(selected) > n_samples:
+            selected = rng.choice(selected, n_samples, replace=False)
+        elif len(selected) < n_samples:
+            remaining = np.setdiff1d(np.arange(n_points), selected)
+            selected = np.concatenate([selected, rng.choice(remaining, n_samples - len(selected), replace=False)])
+
+    else:
+        raise ValueError(f"Unknown subsampling method '{method}', expected 'maximin', 'grid' or 'random'")
+
+    return np.sort(selected)
+
+
+def aggregate_duplicate_rows(df: pd.DataFrame, columns: list[str], target: str) -> tuple[pd.DataFrame, dict]:
+    """
+    Collapses rows with identical values in the given columns into one row holding the mean target.
+
+    Args:
+        df (pd.DataFrame): The data to aggregate.
+        columns (list[str]): The columns identifying a duplicate, e.g. the parameter names.
+        target (str): The target column, averaged over each group of duplicates.
+
+    Returns:
+        tuple: (aggregated_df, stats). aggregated_df has the given columns, the mean target and a "weight"
+            column with the number of rows each aggregated row stands for, in order of first appearance.
+            stats summarises the aggregation (row counts, largest weight and the spread of targets within groups).
+    """
+    grouped = df.groupby(columns, sort=False, dropna=False)[target]
+    aggregated = grouped.agg(["mean", "size", "std"]).reset_index()
+
+    stats = {
+        "rows": int(len(df)),
+        "unique_rows": int(len(aggregated)),
+        "duplicate_fraction": float(1 - len(aggregated) / len(df)) if len(df) else 0.0,
+        "max_weight": int(aggregated["size"].max()) if len(aggregated) else 0,
+        "mean_target_std": float(aggregated["std"].mean()) if aggregated["std"].notna().any() else 0.0
+    }
+
+    aggregated = aggregated.rename(columns={"mean": target, "size": "weight"}).drop(columns="std")
+
+    return aggregated, stats
+
+
+def take_columns(df: pd.DataFrame, columns: list[str], indices: np.ndarray) -> pd.DataFrame:
+    """
+    Gathers the given rows of only the given columns into a new DataFrame backed by one contiguous array.
+
+    Args:
+        df (pd.DataFrame): The source data.
+        columns (list[str]): The columns to gather.
+        indices (np.ndarray): The row positions to gather.
+
+    Returns:
+        pd.DataFrame: The gathered data, with a fresh 0-based index.
+    """
+    dtype = np.result_type(*[df[column].dtype for column in columns])
+    values = np.empty((len(columns), len(indices)), dtype=dtype)
+
+    for i, column in enumerate(columns):
+        np.take(df[column].to_numpy(), indices, out=values[i])
+
+    # The transposed (columns, rows) array is the layout pandas keeps a block in, so no copy is made
+    return pd.DataFrame(values.T, columns=columns, copy=False)
 
 
 def split_df(df: pd.DataFrame, split_frac: float, seed=100) -> tuple[pd.DataFrame]:
     """Splits a dataframe into a train section and test section for training a model"""
 
-    df_shuffled = df.sample(frac=1, random_state=seed).reset_index(drop=True)
-    split_idx = int(split_frac * len(df_shuffled))
-    train_df, test_df = df_shuffled.iloc[:split_idx], df_shuffled.iloc[split_idx:]
+    train_idx, test_idx = split_indices(len(df), split_frac, seed)
+    train_df = df.take(train_idx).reset_index(drop=True)
+    test_df = df.take(test_idx).reset_index(drop=True)
 
     return train_df, test_df
 
 
+@contextmanager
+def isolated_tempdir(work_dir: str):
+    """
+    Redirects temporary files created by this process (and any child it spawns) into work_dir.
+
+    PySR writes hall_of_fame.csv to a fresh tempfile.mkdtemp() directory, so pointing the temp
+    root at a per-run directory makes the file's location known without searching for it.
+
+    Args:
+        work_dir (str): The directory to use as the temporary root. Created if missing.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    work_dir = os.path.abspath(work_dir)
+
+    env_vars = ("TMPDIR", "TEMP", "TMP")
+    old_env = {var: os.environ.get(var) for var in env_vars}
+    old_tempdir = tempfile.tempdir
+
+    try:
+        for var in env_vars:
+            os.environ[var] = work_dir
+        tempfile.tempdir = work_dir
+
+        yield work_dir
+    finally:
+        tempfile.tempdir = old_tempdir
+        for var, value in old_env.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 digest of a file's contents, reading it in chunks.
+
+    Args:
+        path (str): The path of the file to hash.
+        chunk_size (int): Number of bytes read at a time (Default: 1 MiB).
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def hash_fields(**fields) -> str:
+    """
+    Computes a stable SHA-256 digest of keyword fields by hashing their canonical JSON form.
+
+    Returns:
+        str: The hex digest.
+    """
+    canonical = json.dumps(fields, sort_keys=True, default=str, separators=(",", ":"))
+
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
 def find_hof_file(pattern) -> str | None:
     """
     Searches for the most recent hall_of_fame.csv file in the temporary directory.
@@ -0,0 +1,122 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from .general_utils import file_digest
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# Cached copies of each input CSV are kept in this folder, next to the CSV
+CACHE_FOLDER = ".cache"
+
+
+def _cache_paths(csv_path: str) -> tuple[str, str]:
+    folder = os.path.join(os.path.dirname(csv_path) or ".", CACHE_FOLDER)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+
+    return os.path.join(folder, f"{stem}.feather"), os.path.join(folder, f"{stem}.json")
+
+
+def _read_metadata(meta_path: str) -> dict:
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_metadata(meta_path: str, metadata: dict):
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=4)
+
+    os.replace(tmp_path, meta_path)
+
+
+def cached_file_digest(csv_path: str) -> str:
+    """
+    Returns the SHA-256 digest of a CSV, reusing the digest stored with its cache when the file's
+    size and modification time have not changed since it was hashed.
+
+    Args:
+        csv_path (str): The path of the CSV.
+
+    Returns:
+        str: The hex digest.
+    """
+    _, meta_path = _cache_paths(csv_path)
+    metadata = _read_metadata(meta_path)
+    stat = os.stat(csv_path)
+
+    if metadata.get("size") == stat.st_size and metadata.get("mtime_ns") == stat.st_mtime_ns:
+        return metadata["sha256"]
+
+    return file_digest(csv_path)
+
+
+def load_input_csv(
+        csv_path: str,
+        columns: list[str] | None = None,
+        float32: bool = False,
+        digest: str | None = None
+    ) -> pd.DataFrame:
+    """
+    Loads an input CSV through a columnar Feather (Arrow IPC) cache.
+
+    The first load converts the whole CSV to .cache/<name>.feather next to it. Later loads read
+    only the requested columns from the cache. The cache is rebuilt when the CSV's contents
+    change: a size or modification time change triggers a re-hash, and the cache is only
+    rebuilt if the hash differs. Without pyarrow, the CSV is read directly.
+
+    Args:
+        csv_path (str): The path of the CSV.
+        columns (list[str], optional): The columns to load (Default: all).
+        float32 (bool): Downcast every numeric column (integers included) to float32, halving their memory (Default: False).
+        digest (str, optional): The CSV's SHA-256 digest if already known (e.g. from cached_file_digest), used
+            instead of hashing the file again when the cache has to be checked or rebuilt (Default: None).
+
+    Returns:
+        pd.DataFrame: The loaded data.
+    """
+    if pyarrow is None:
+        df = pd.read_csv(csv_path, usecols=columns)
+    else:
+        feather_path, meta_path = _cache_paths(csv_path)
+        metadata = _read_metadata(meta_path)
+        stat = os.stat(csv_path)
+
+        valid = os.path.exists(feather_path) and metadata.get("size") == stat.st_size
+        if valid and metadata.get("mtime_ns") != stat.st_mtime_ns:
+            # Touched but possibly unchanged, so compare contents before throwing the cache away
+            if digest is None:
+                digest = file_digest(csv_path)
+            valid = metadata.get("sha256") == digest
+            if valid:
+                _write_metadata(meta_path, {**metadata, "mtime_ns": stat.st_mtime_ns})
+
+        if not valid:
+            print(f"Building columnar cache of '{csv_path}' at '{feather_path}'")
+            os.makedirs(os.path.dirname(feather_path), exist_ok=True)
+
+            tmp_path = f"{feather_path}.{os.getpid()}.tmp"
+            pd.read_csv(csv_path).to_feather(tmp_path)
+            os.replace(tmp_path, feather_path)
+
+            _write_metadata(meta_path, {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": digest if digest is not None else file_digest(csv_path)
+            })
+
+        df = pd.read_feather(feather_path, columns=columns)
+
+    if float32:
+        # Integer columns too, so the whole table can be shared as float32 rather than widened back to float64
+        numeric_columns = df.select_dtypes(include="number").columns
+        df[numeric_columns] = df[numeric_columns].astype(np.float32)
+
+    return df
@@ -0,0 +1,309 @@
+import os
+import sys
+import time
+import signal
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Seconds between RSS samples. Without psutil, finding a process's descendants means reading the
+# stat file of every process on the host (about 10us each), so samples are spaced further apart
+RSS_SAMPLE_INTERVAL = 0.5
+RSS_SAMPLE_INTERVAL_PROC = 2.0
+
+
+def _read_proc_stat(pid: int) -> list[str] | None:
+    # The fields after the parenthesised command name, which may itself contain spaces
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+
+    return stat[stat.rfind(")") + 2:].split()
+
+
+def process_tree(pid: int) -> list[int]:
+    """
+    Lists a process and all of its descendants, parents before children.
+
+    Uses psutil when installed, and /proc otherwise. Without either only pid itself is returned.
+
+    Args:
+        pid (int): The root process id.
+
+    Returns:
+        list[int]: The process ids of the tree, starting with pid.
+    """
+    if psutil is not None:
+        try:
+            return [pid] + [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return [pid]
+
+    if not os.path.isdir("/proc"):
+        return [pid]
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            fields = _read_proc_stat(int(entry))
+            if fields is not None:
+                children.setdefault(int(fields[1]), []).append(int(entry))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, []))
+
+    return tree
+
+
+def tree_cpu_seconds(pid: int) -> float | None:
+    """
+    Returns the user and system CPU time used so far by a process and its live descendants.
+
+    Args:
+        pid (int): The root process id.
+
+    Returns:
+        float | None: CPU seconds, or None where neither psutil nor /proc is available.
+    """
+    total = 0.0
+    if psutil is not None:
+        for tree_pid in process_tree(pid):
+            try:
+                times = psutil.Process(tree_pid).cpu_times()
+                total += times.user + times.system
+            except psutil.Error:
+                pass
+
+        return total
+
+    if not os.path.isdir("/proc"):
+        return None
+
+    for tree_pid in process_tree(pid):
+        fields = _read_proc_stat(tree_pid)
+        if fields is not None:
+            total += (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+    return total
+
+
+def tree_rss_bytes(pid: int) -> int | None:
+    """
+    Returns the summed resident set size of a process and its live descendants, such as a Julia child.
+
+    Pages shared between the processes are counted once per process, so this is an upper bound.
+
+    Args:
+        pid (int): The root process id.
+
+    Returns:
+        int | None: Bytes, or None where neither psutil nor /proc is available.
+    """
+    total = 0
+    if psutil is not None:
+        for tree_pid in process_tree(pid):
+            try:
+                total += psutil.Process(tree_pid).memory_info().rss
+            except psutil.Error:
+                pass
+
+        return total
+
+    if not os.path.isdir("/proc"):
+        return None
+
+    for tree_pid in process_tree(pid):
+        fields = _read_proc_stat(tree_pid)
+        if fields is not None:
+            total += int(fields[21]) * _PAGE_SIZE
+
+    return total
+
+
+class RSSSampler:
+    """
+    Samples the process-tree RSS of a process from a background thread and keeps the peak since the last reset.
+
+    Each sample walks the host's process table to find the tree (see process_tree), so its cost grows with the
+    number of processes on the host: a few milliseconds per sample on a host running thousands. The interval
+    defaults to RSS_SAMPLE_INTERVAL with psutil and RSS_SAMPLE_INTERVAL_PROC without it.
+    """
+    def __init__(self, pid: int | None = None, interval: float | None = None):
+        self.pid = pid if pid is not None else os.getpid()
+        if interval is None:
+            interval = RSS_SAMPLE_INTERVAL if psutil is not None else RSS_SAMPLE_INTERVAL_PROC
+        self.interval = interval
+        self.peak = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        rss = tree_rss_bytes(self.pid)
+        if rss is not None:
+            with self._lock:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def reset(self):
+        """Starts a new peak from the current RSS."""
+        with self._lock:
+            self.peak = None
+        self._sample()
+
+    def read(self) -> int | None:
+        """Returns the peak RSS in bytes since the last reset, including the current RSS."""
+        self._sample()
+        with self._lock:
+            return self.peak
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def terminate_tree(pid: int, grace: float = 5.0):
+    """
+    Terminates a process and all of its descendants, first with SIGTERM and then, for any still
+    alive after the grace period, with SIGKILL.
+
+    Args:
+        pid (int): The root process id.
+        grace (float): Seconds to wait for the processes to exit after SIGTERM (Default: 5.0).
+    """
+    # Collect the whole tree before signalling, as children are reparented once their parent dies
+    tree = process_tree(pid)
+
+    for tree_pid in tree:
+        try:
+            os.kill(tree_pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    deadline = time.monotonic() + grace
+    alive = tree
+    while alive and time.monotonic() < deadline:
+        time.sleep(0.1)
+        alive = [tree_pid for tree_pid in alive if _is_alive(tree_pid)]
+
+    for tree_pid in alive:
+        try:
+            os.kill(tree_pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            pass
+
+
+def _is_alive(pid: int) -> bool:
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+
+    fields = _read_proc_stat(pid)
+    if fields is not None:
+        return fields[0] != "Z"
+
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+
+    return True
+
+
+def available_cpus() -> list[int]:
+    """
+    Returns the CPUs this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(n_slots: int, cores: int | None = None, pin: bool = False) -> list[dict]:
+    """
+    Splits a core budget evenly between concurrent worker slots.
+
+    Args:
+        n_slots (int): The number of concurrent workers.
+        cores (int, optional): The total number of cores to use (Default: every available CPU).
+        pin (bool): Give each slot its own disjoint set of CPUs to be pinned to (Default: False).
+
+    Returns:
+        list[dict]: One dict per slot, with "threads" (the slot's share of the cores, at least 1)
+            and "cpus" (the CPUs to pin the slot to, or None).
+
+    Raises:
+        ValueError: If pin is set with fewer cores than slots, as the slots could not be given disjoint CPUs.
+    """
+    cpus = available_cpus()
+    cores = min(cores or len(cpus), len(cpus))
+    threads = max(cores // n_slots, 1)
+
+    if pin and cores < n_slots:
+        raise ValueError(f"Cannot pin {n_slots} workers to disjoint CPUs with only {cores} cores")
+
+    slots = []
+    for slot in range(n_slots):
+        slot_cpus = None
+        if pin and hasattr(os, "sched_setaffinity"):
+            slot_cpus = cpus[slot * threads:(slot + 1) * threads]
+        slots.append({"threads": threads, "cpus": slot_cpus})
+
+    return slots
+
+
+def available_memory() -> int | None:
+    """
+    Returns the memory available to new processes, in bytes, or None where it cannot be determined.
+    """
+    if psutil is not None:
+        return psutil.virtual_memory().available
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def peak_rss_bytes() -> int | None:
+    """
+    Returns the peak resident set size of this process, or of its largest waited-for child process
+    if that is higher, in bytes. None where the resource module is unavailable.
+    """
+    if resource is None:
+        return None
+
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024